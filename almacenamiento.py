@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento de incidencias con una interfaz común para la interfaz de usuario:
+
+    put_incident(inc)                                  → id
+    query(filtros, orden, limit, cursor)               → (incidencias, cursor siguiente)
+    aggregate(campos, filtros)                         → {campo: Counter}
+    iterar(filtros, con_id)                            → incidencias (o pares (id, incidencia)) en streaming
+    resumen(campos, filtros, limit)                    → (conteos, las `limit` más recientes)
+
+Hay dos implementaciones:
+
+- AlmacenS3: un objeto JSON por incidencia en el esquema particionado de particiones.py.
+  Las consultas recorren las particiones que pueden cumplir los filtros.
+- AlmacenSQLite: un fichero local con índices por categoría, fecha, calle normalizada
+  e ID del activo, y búsqueda de texto (FTS5) en las descripciones. Permite trabajar
+  sin conexión (municipios pequeños, entornos de prueba).
+
+Los filtros son un diccionario con cualquiera de FILTROS:
+categoria, desde/hasta ('YYYY-MM-DD', incluidos), calle (se compara normalizada),
+activo (ID del activo) y texto (palabras de las descripciones ES/EN). En `texto` cada
+palabra debe ser el comienzo de alguna palabra de la descripción, sin distinguir
+mayúsculas ni tildes ('farol' encuentra 'Farola' y 'farolas'), igual en los dos almacenes.
+
+    python almacenamiento.py importar --sqlite incidencias.db      # copia el bucket a SQLite
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from unidecode import unidecode
+
+from exportar import iterar_incidencias, cumple
+from metrics import span
+from particiones import PREFIJO, _listar, _uuid, clave_incidencia, listar_claves
+from street_bundling import normalize_street
+
+FILTROS = ("categoria", "desde", "hasta", "calle", "activo", "texto")
+# Campos por los que se puede agregar; 'calle' y 'fecha' se derivan de la incidencia
+CAMPOS_AGREGADOS = ("Categoría", "Estado", "Municipio", "ID", "calle", "fecha")
+ORDENES = ("-Timestamp", "Timestamp")
+
+
+def calle_de(inc):
+    loc = inc.get("Ubicación", inc.get("Ubicacion", ""))
+    return normalize_street(loc.split(",")[0]) if loc else ""
+
+
+def activo_de(inc):
+    asset_id = inc.get("ID")
+    return asset_id if asset_id and asset_id != "No disponible" else None
+
+
+def _valor(inc, campo):
+    if campo == "calle":
+        return calle_de(inc)
+    if campo == "fecha":
+        return (inc.get("Timestamp") or "")[:10]
+    return inc.get(campo)
+
+
+def palabras_de(texto):
+    """
+    Palabras en minúsculas y sin tildes, separadas como en el tokenizador unicode61 de FTS5.
+    """
+    return re.findall(r"[^\W_]+", unidecode(texto or "").lower())
+
+
+def _validar(filtros, orden=None, campos=()):
+    desconocidos = set(filtros or {}) - set(FILTROS)
+    if desconocidos:
+        raise ValueError(f"Filtros no soportados: {', '.join(sorted(desconocidos))}")
+    if orden is not None and orden not in ORDENES:
+        raise ValueError(f"Orden no soportado: {orden}")
+    for campo in campos:
+        if campo not in CAMPOS_AGREGADOS:
+            raise ValueError(f"No se puede agregar por: {campo}")
+    return filtros or {}
+
+
+class AlmacenS3:
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+
+    def put_incident(self, inc, incidencia_id=None):
+        incidencia_id = incidencia_id or str(uuid.uuid4())
+        with span("s3.put_object"):
+            self.s3.put_object(Bucket=self.bucket, Key=clave_incidencia(inc, incidencia_id), Body=json.dumps(inc))
+        return incidencia_id
+
+    def iterar(self, filtros=None, con_id=False):
+        """
+        Incidencias que cumplen los filtros, en streaming y sin orden. Con `con_id` se
+        devuelven pares (id, incidencia) para reescribirlas con put_incident(inc, id).
+        """
+        filtros = _validar(filtros)
+        categoria, desde, hasta = filtros.get("categoria"), filtros.get("desde"), filtros.get("hasta")
+        calle = normalize_street(filtros["calle"]) if filtros.get("calle") else None
+        claves = listar_claves(self.s3, self.bucket, categoria, desde, hasta)
+        activo = filtros.get("activo")
+        palabras = palabras_de(filtros.get("texto"))
+        for clave, inc in iterar_incidencias(self.s3, self.bucket, claves, con_claves=True):
+            if not cumple(inc, categoria, desde, hasta, calle):
+                continue
+            if activo and inc.get("ID") != activo:
+                continue
+            if palabras:
+                texto = palabras_de(f"{inc.get('Descripción adicional (ES)', '')} {inc.get('Descripción adicional (EN)', '')}")
+                if not all(any(t.startswith(p) for t in texto) for p in palabras):
+                    continue
+            yield (_uuid(clave), inc) if con_id else inc
+
+    def query(self, filtros=None, orden="-Timestamp", limit=None, cursor=None):
+        """
+        Sin índices hay que leer todo lo que cumple los filtros para ordenarlo; con
+        `limit` sólo se conservan en memoria las necesarias. El cursor es un desplazamiento.
+        """
+        _validar(filtros, orden)
+        desplazamiento = int(cursor or 0)
+        clave = lambda inc: inc.get("Timestamp", "")
+        incidencias = self.iterar(filtros)
+        if limit is None:
+            ordenadas = sorted(incidencias, key=clave, reverse=orden.startswith("-"))[desplazamiento:]
+            return ordenadas, None
+        mejores = heapq.nlargest if orden.startswith("-") else heapq.nsmallest
+        ordenadas = mejores(desplazamiento + limit + 1, incidencias, key=clave)[desplazamiento:]
+        siguiente = str(desplazamiento + limit) if len(ordenadas) > limit else None
+        return ordenadas[:limit], siguiente
+
+    def aggregate(self, campos, filtros=None, cancelado=None):
+        """
+        Conteos por cada campo en una sola pasada. Si se activa `cancelado` se
+        interrumpe con TimeoutError.
+        """
+        _validar(filtros, campos=campos)
+        conteos = {campo: Counter() for campo in campos}
+        for inc in self.iterar(filtros):
+            if cancelado is not None and cancelado.is_set():
+                raise TimeoutError("Consulta cancelada")
+            for campo in campos:
+                conteos[campo][_valor(inc, campo) or "No disponible"] += 1
+        return conteos
+
+    def resumen(self, campos, filtros=None, limit=10):
+        """
+        aggregate() y las `limit` incidencias más recientes en una sola lectura del bucket.
+        """
+        _validar(filtros, campos=campos)
+        conteos = {campo: Counter() for campo in campos}
+
+        def contar(incidencias):
+            for inc in incidencias:
+                for campo in campos:
+                    conteos[campo][_valor(inc, campo) or "No disponible"] += 1
+                yield inc
+
+        recientes = heapq.nlargest(limit, contar(self.iterar(filtros)), key=lambda inc: inc.get("Timestamp", ""))
+        return conteos, recientes
+
+
+class AlmacenSQLite:
+    """
+    Una conexión compartida por todos los hilos; cada operación tarda milisegundos.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS incidencias (
+            id TEXT PRIMARY KEY,
+            categoria TEXT,
+            timestamp TEXT,
+            fecha TEXT,
+            estado TEXT,
+            municipio TEXT,
+            calle TEXT,
+            activo TEXT,
+            datos TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_categoria ON incidencias (categoria, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_timestamp ON incidencias (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_calle ON incidencias (calle, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_activo ON incidencias (activo, timestamp);
+        CREATE VIRTUAL TABLE IF NOT EXISTS incidencias_fts USING fts5 (
+            descripcion_es, descripcion_en, tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """
+    # Columna de la tabla para cada campo agregable
+    COLUMNAS = {"Categoría": "categoria", "Estado": "estado", "Municipio": "municipio",
+                "ID": "activo", "calle": "calle", "fecha": "fecha"}
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conexion:
+            if ruta != ":memory:":
+                self._conexion.execute("PRAGMA journal_mode = WAL")
+            self._conexion.executescript(self.ESQUEMA)
+
+    def put_incident(self, inc, incidencia_id=None):
+        incidencia_id = incidencia_id or str(uuid.uuid4())
+        self.put_many([(incidencia_id, inc)])
+        return incidencia_id
+
+    def put_many(self, pares):
+        """
+        Inserta (o reemplaza) varias incidencias (id, incidencia) en una transacción.
+        """
+        with self._lock, self._conexion:
+            for incidencia_id, inc in pares:
+                # El texto indexado se enlaza por rowid: al reemplazar, se borra el de la fila anterior
+                anterior = self._conexion.execute("SELECT rowid FROM incidencias WHERE id = ?",
+                                                  (incidencia_id,)).fetchone()
+                if anterior:
+                    self._conexion.execute("DELETE FROM incidencias_fts WHERE rowid = ?", anterior)
+                rowid = self._conexion.execute(
+                    "INSERT OR REPLACE INTO incidencias VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (incidencia_id, inc.get("Categoría") or "Desconocida", inc.get("Timestamp", ""),
+                     (inc.get("Timestamp") or "")[:10], inc.get("Estado"), inc.get("Municipio"),
+                     calle_de(inc), activo_de(inc), json.dumps(inc))).lastrowid
+                self._conexion.execute(
+                    "INSERT INTO incidencias_fts (rowid, descripcion_es, descripcion_en) VALUES (?, ?, ?)",
+                    (rowid, inc.get("Descripción adicional (ES)", ""), inc.get("Descripción adicional (EN)", "")))
+
+    def _where(self, filtros):
+        condiciones, parametros = [], []
+        if filtros.get("categoria"):
+            condiciones.append("categoria = ?")
+            parametros.append(filtros["categoria"])
+        if filtros.get("desde"):
+            condiciones.append("fecha >= ?")
+            parametros.append(filtros["desde"])
+        if filtros.get("hasta"):
+            condiciones.append("fecha <= ?")
+            parametros.append(filtros["hasta"])
+        if filtros.get("calle"):
+            condiciones.append("calle = ?")
+            parametros.append(normalize_street(filtros["calle"]))
+        if filtros.get("activo"):
+            condiciones.append("activo = ?")
+            parametros.append(filtros["activo"])
+        palabras = palabras_de(filtros.get("texto"))
+        if palabras:
+            # Búsqueda por prefijo de cada palabra; al ser sólo letras y números, el texto
+            # del usuario no se interpreta como sintaxis FTS
+            consulta = " ".join(f'"{p}"*' for p in palabras)
+            condiciones.append("rowid IN (SELECT rowid FROM incidencias_fts WHERE incidencias_fts MATCH ?)")
+            parametros.append(consulta)
+        return (" WHERE " + " AND ".join(condiciones) if condiciones else ""), parametros
+
+    def query(self, filtros=None, orden="-Timestamp", limit=None, cursor=None):
+        """
+        Paginación por clave (Timestamp, id): el cursor es la última incidencia devuelta.
+        """
+        filas, siguiente = self._consultar(filtros, orden, limit, cursor)
+        return [json.loads(datos) for _, datos in filas], siguiente
+
+    def _consultar(self, filtros, orden, limit, cursor):
+        # Filas (id, datos) y cursor siguiente
+        filtros = _validar(filtros, orden)
+        where, parametros = self._where(filtros)
+        descendente = orden.startswith("-")
+        if cursor:
+            timestamp, incidencia_id = json.loads(cursor)
+            where += (" AND " if where else " WHERE ") + f"(timestamp, id) {'<' if descendente else '>'} (?, ?)"
+            parametros += [timestamp, incidencia_id]
+        direccion = "DESC" if descendente else "ASC"
+        sql = f"SELECT id, timestamp, datos FROM incidencias{where} ORDER BY timestamp {direccion}, id {direccion}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parametros.append(limit + 1)
+        with self._lock:
+            filas = self._conexion.execute(sql, parametros).fetchall()
+        siguiente = None
+        if limit is not None and len(filas) > limit:
+            filas = filas[:limit]
+            siguiente = json.dumps([filas[-1][1], filas[-1][0]])
+        return [(incidencia_id, datos) for incidencia_id, _, datos in filas], siguiente
+
+    def iterar(self, filtros=None, tamano_pagina=1000, con_id=False):
+        """
+        Incidencias que cumplen los filtros, página a página (de la más reciente a la más
+        antigua). Con `con_id` se devuelven pares (id, incidencia).
+        """
+        cursor = None
+        while True:
+            filas, cursor = self._consultar(filtros, "-Timestamp", tamano_pagina, cursor)
+            for incidencia_id, datos in filas:
+                yield (incidencia_id, json.loads(datos)) if con_id else json.loads(datos)
+            if cursor is None:
+                return
+
+    def aggregate(self, campos, filtros=None, cancelado=None):
+        filtros = _validar(filtros, campos=campos)
+        where, parametros = self._where(filtros)
+        conteos = {}
+        with self._lock:
+            for campo in campos:
+                columna = self.COLUMNAS[campo]
+                filas = self._conexion.execute(
+                    f"SELECT COALESCE(NULLIF({columna}, ''), 'No disponible'), COUNT(*) "
+                    f"FROM incidencias{where} GROUP BY 1", parametros).fetchall()
+                conteos[campo] = Counter(dict(filas))
+        return conteos
+
+    def resumen(self, campos, filtros=None, limit=10):
+        # Con índices, los conteos y las más recientes son dos consultas baratas
+        return self.aggregate(campos, filtros), self.query(filtros, limit=limit)[0]
+
+
+def importar(s3, bucket, destino, lote=1000, max_workers=8):
+    """
+    Copia todas las incidencias del bucket a un AlmacenSQLite. Devuelve cuántas copió.
+    """
+    def descargar(clave):
+        with span("s3.get_object"):
+            contenido = s3.get_object(Bucket=bucket, Key=clave)["Body"].read().decode("utf-8")
+        # El id es el nombre del objeto, así que importar dos veces no duplica
+        return os.path.basename(clave)[:-len(".json")], json.loads(contenido) if contenido.strip() else None
+
+    claves = _listar(s3, bucket, PREFIJO)
+    copiadas = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            bloque = list(islice(claves, lote))
+            if not bloque:
+                break
+            pares = [(incidencia_id, inc) for incidencia_id, inc in pool.map(descargar, bloque)
+                     if inc is not None]
+            destino.put_many(pares)
+            copiadas += len(pares)
+    return copiadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Almacenamiento de incidencias")
+    parser.add_argument("accion", choices=["importar"])
+    parser.add_argument("--sqlite", required=True, help="Fichero SQLite de destino")
+    parser.add_argument("--bucket", default="incidencias-ayuntamientos-dh")
+    parser.add_argument("--region", default="us-east-1")
+    args = parser.parse_args(argv)
+
+    import boto3
+    s3 = boto3.client("s3", region_name=args.region)
+    copiadas = importar(s3, args.bucket, AlmacenSQLite(args.sqlite))
+    print(f"{copiadas} incidencias copiadas a {args.sqlite}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,28 @@ import hydralit_components as hc
 import logging
 import streamlit as st
 import requests
-import boto3
 import uuid
-import json
+import io
+import os
+import tempfile
 from datetime import datetime
-import re
 import pandas as pd
 from pathlib import Path
 from PIL import Image
 from transformers import MarianMTModel, MarianTokenizer, pipeline
 import torch
 from streamlit.components.v1 import html
+from html import escape
 from street_bundling import group_by_street
+from label_parsing import extraer_campos_etiqueta
+from language_detection import detectar_idioma
+from cascade_classifier import cargar_ultimo
+from thumbnails import subir_miniatura
+from concurrent.futures import ThreadPoolExecutor
+from exportar import exportar
+from hotspots import HotspotDetector
+from federacion import Federacion, vista_regional
+from metrics import span, log_evento, nuevo_id_correlacion, iniciar_servidor, con_contexto
 
 # Set page configuration as the first Streamlit command
 st.set_page_config(
@@ -26,6 +36,9 @@ st.set_page_config(
 # Suppress Streamlit and PyTorch warnings
 logging.getLogger("streamlit").setLevel(logging.INFO)
 
+# Endpoint /metrics (sólo si URBANEYE_METRICS y URBANEYE_METRICS_PORT están configurados)
+iniciar_servidor()
+
 # Contexto detallado para el chatbot
 INSTRUCCIONES_CHATBOT = """
 Eres un asistente virtual para ayudar a los ciudadanos a reportar incidencias relacionadas con el mobiliario urbano en una plataforma web de gestión de incidencias. La plataforma tiene una estructura con las siguientes páginas accesibles desde un menú de navegación:
@@ -48,47 +61,87 @@ Eres un asistente virtual para ayudar a los ciudadanos a reportar incidencias re
 Responde siempre en tono profesional, breve y cercano, en español.
 """
 
-# Configurar clientes de AWS
-s3 = boto3.client('s3', region_name='us-east-1')
-rekognition = boto3.client('rekognition', region_name='us-east-1')
-bucket_name = 'incidencias-ayuntamientos-dh'
+@st.cache_resource(show_spinner=False)
+def cargar_federacion():
+    # Una por proceso: conserva entre ejecuciones los clientes de AWS y los almacenes abiertos
+    return Federacion.desde_entorno()
+
+
+# Configurar los municipios (bucket y región de cada uno); los clientes de AWS se crean al usarse
+federacion = cargar_federacion()
+
+# Exportaciones mayores no se sirven desde la memoria de Streamlit: se suben al bucket
+# y se descargan con una URL prefirmada
+MAX_EXPORTACION_UI = int(float(os.getenv("URBANEYE_EXPORTAR_MAX_MB", "50")) * 1024 * 1024)
 
 # Determinar el dispositivo (forzar CPU para evitar problemas con MPS)
 device = "cpu"
-print(f"Using device: {device}")
+log_evento("Using device", device=device)
+
+# Modelos de traducción por dirección (origen, destino)
+MODELOS_TRADUCCION = {
+    ("en", "es"): "Helsinki-NLP/opus-mt-en-es",
+    ("es", "en"): "Helsinki-NLP/opus-mt-es-en",
+}
+
+
+@st.cache_resource(show_spinner=False)
+def cargar_traductor(nombre):
+    # Se carga una vez por proceso y se reutiliza entre ejecuciones del script
+    tokenizer = MarianTokenizer.from_pretrained(nombre)
+    modelo = MarianMTModel.from_pretrained(nombre).to(device)
+    return modelo, tokenizer
+
 
-# Cargar modelo y tokenizer para traducción español -> inglés
-model_name = "Helsinki-NLP/opus-mt-en-es"
+# Cargar modelo y tokenizer para traducción inglés -> español
+model_name = MODELOS_TRADUCCION[("en", "es")]
 model, tokenizer = None, None
 try:
-    tokenizer = MarianTokenizer.from_pretrained(model_name)
-    model = MarianMTModel.from_pretrained(model_name)
-    # Mover el modelo a CPU de manera segura
-    model = model.to_empty(device="cpu")
-    print("Translation model initialized successfully")
+    model, tokenizer = cargar_traductor(model_name)
+    log_evento("Translation model initialized successfully", modelo=model_name)
 except Exception as e:
-    print(f"Error loading translation model: {e}")
+    log_evento("Error loading translation model", logging.ERROR, error=str(e))
+
+@st.cache_resource(show_spinner=False)
+def cargar_clasificador():
+    # Usar un modelo más ligero para evitar problemas de memoria
+    return pipeline("zero-shot-classification",
+                    model="valhalla/distilbart-mnli-12-1",
+                    device="cpu")  # Forzar CPU
+
+
+@st.cache_resource(show_spinner=False)
+def cargar_cascada(tarea):
+    # Última versión del modelo lineal entrenado con cascade_classifier.py (None si no hay)
+    return cargar_ultimo(tarea)
+
 
 # Inicializar el clasificador de zero-shot para categorización automática
 classifier = None
 try:
-    # Usar un modelo más ligero para evitar problemas de memoria
-    classifier = pipeline("zero-shot-classification", 
-                        model="valhalla/distilbart-mnli-12-1", 
-                        device="cpu")  # Forzar CPU
-    print("Classifier initialized successfully")
+    classifier = cargar_clasificador()
+    log_evento("Classifier initialized successfully")
 except Exception as e:
-    print(f"Error loading zero-shot classifier: {e}")
+    log_evento("Error loading zero-shot classifier", logging.ERROR, error=str(e))
+
+# Modelo lineal que responde antes que el zero-shot cuando está seguro
+cascada_categoria = None
+try:
+    cascada_categoria = cargar_cascada("categoria")
+    if cascada_categoria:
+        log_evento("Cascade classifier loaded", version=cascada_categoria.version,
+                   umbral=cascada_categoria.umbral)
+except Exception as e:
+    log_evento("Error loading cascade classifier", logging.ERROR, error=str(e))
 
 
 def traducir_texto(texto, modelo=model, tokenizer=tokenizer):
     if not texto.strip() or modelo is None or tokenizer is None:
         return ""
     try:
-        # Asegurarse de que el modelo está en CPU
-        modelo = modelo.to_empty(device="cpu")
         batch = tokenizer([texto], return_tensors="pt", padding=True)
-        translated = modelo.generate(**batch)
+        with span("marian.generate", modelo=getattr(modelo, "name_or_path", "")):
+            translated = modelo.generate(**batch)
         texto_traducido = tokenizer.decode(translated[0], skip_special_tokens=True)
         return texto_traducido
     except Exception as e:
@@ -187,9 +240,14 @@ def setup_sidebar():
                 st.session_state.selected_page = name
 
         if st.session_state.get("authenticated"):
+            if len(federacion) > 1:
+                st.selectbox("🏛️ Municipio", list(federacion.municipios), key="municipio",
+                             format_func=lambda m: federacion.municipios[m].nombre)
             nav_button("Home", "🏠")
             nav_button("Ver Incidencias", "📋")
             nav_button("Estadísticas", "📊")
+            if len(federacion) > 1:
+                nav_button("Vista Regional", "🗺️")
             nav_button("Cerrar Sesión", "🔒")
         else:
             nav_button("Home", "🏠")
@@ -236,16 +294,51 @@ def setup_sidebar():
         """)
 
 # Función para extraer texto de la imagen con Rekognition
-def extract_text_from_image(image):
+# Devuelve el texto detectado, la clave de la foto en S3 y la de su miniatura
+def extract_text_from_image(image, municipio=None):
+    municipio = municipio or federacion.por_defecto
+    s3_municipio = federacion.s3(municipio)
     try:
         image_key = f"images/{str(uuid.uuid4())}.png"
-        s3.upload_fileobj(image, bucket_name, image_key)
-        response = rekognition.detect_text(Image={'S3Object': {'Bucket': bucket_name, 'Name': image_key}})
+        datos = image.getvalue()
+        with span("s3.upload_fileobj"):
+            s3_municipio.upload_fileobj(io.BytesIO(datos), municipio.bucket, image_key)
+        # La miniatura se genera y se sube mientras Rekognition procesa la foto
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            futuro = pool.submit(con_contexto(subir_miniatura), s3_municipio, municipio.bucket, image_key, datos)
+            with span("rekognition.detect_text"):
+                response = federacion.rekognition(municipio).detect_text(
+                    Image={'S3Object': {'Bucket': municipio.bucket, 'Name': image_key}})
+            try:
+                with span("miniatura"):
+                    thumbnail_key = futuro.result()
+            except Exception as e:
+                log_evento("Error al generar la miniatura", logging.WARNING, error=str(e))
+                thumbnail_key = None
         detected_text = ' '.join([t['DetectedText'] for t in response['TextDetections'] if t['Type'] == 'LINE'])
-        return detected_text
+        return detected_text, image_key, thumbnail_key
     except Exception as e:
         st.error(f"Error al procesar la imagen: {str(e)}")
-        return None
+        return None, None, None
+
+
+@st.cache_resource(show_spinner=False)
+def detector_hotspots(municipio_id):
+    # Un detector por municipio y proceso, alimentado al guardar cada incidencia
+    return HotspotDetector.desde_entorno()
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def url_prefirmada(municipio_id, clave):
+    # El navegador descarga la imagen directamente de S3; el servidor sólo firma la URL
+    municipio = federacion.municipio(municipio_id)
+    return federacion.s3(municipio).generate_presigned_url(
+        'get_object', Params={'Bucket': municipio.bucket, 'Key': clave}, ExpiresIn=3600)
+
+
+def municipio_actual():
+    # Municipio elegido por el técnico en la barra lateral (el de por defecto si sólo hay uno)
+    return federacion.municipio(st.session_state.get("municipio"))
 
 # Home page
 def pagina_home():
@@ -282,6 +375,170 @@ def login():
         else:
             st.error("Credenciales incorrectas")
 
+# Procesa una incidencia ya validada: OCR, traducción, clasificación y guardado.
+# Se guarda en el municipio indicado o, si no se indica, en el de la ubicación.
+# Devuelve los datos guardados, o None si no se pudo completar.
+def procesar_incidencia(image, ubicacion, descripcion_input, municipio=None):
+    municipio = municipio or federacion.resolver(ubicacion)
+    # Procesar imagen con Rekognition
+    try:
+        detected_text, image_key, thumbnail_key = extract_text_from_image(image, municipio)
+        log_evento("Extracción de texto completada", texto=detected_text)
+    except Exception as e:
+        st.error(f"Error al procesar la imagen con Rekognition: {str(e)}")
+        return
+
+    if detected_text:
+        # Extraer datos del texto detectado
+        campos = extraer_campos_etiqueta(detected_text)
+
+        # Detectar el idioma y traducir sólo en la dirección que falta:
+        # el español se guarda para los técnicos y el inglés va al clasificador
+        idioma = detectar_idioma(descripcion_input)
+        descripcion_es = descripcion_input
+        descripcion_en = descripcion_input
+        try:
+            if idioma == "es":
+                en_model, en_tokenizer = cargar_traductor(MODELOS_TRADUCCION[("es", "en")])
+                descripcion_en = traducir_texto(descripcion_input, en_model, en_tokenizer) or descripcion_input
+            else:
+                descripcion_es = traducir_texto(descripcion_input, model, tokenizer) or descripcion_input
+            log_evento("Traducción completada", idioma=idioma, es=descripcion_es, en=descripcion_en)
+        except Exception as e:
+            st.warning(f"Error en la traducción: {e}. Usando descripción original.")
+            log_evento("Error en la traducción", logging.WARNING, error=str(e))
+            descripcion_es = descripcion_input
+            descripcion_en = descripcion_input
+
+        # Clasificación automática de la categoría
+        categorias = ["Farola", "Banco", "Papelera","Contenedor", "Señalización", "Otros"]
+        categoria = "Otros"  # Fallback por defecto
+        probabilidades = {}
+        metodo = "zero-shot"
+        try:
+            # Primero el modelo lineal; el zero-shot sólo si no supera el umbral
+            prediccion = None
+            if cascada_categoria is not None:
+                with span("clasificador_lineal", tarea="categoria"):
+                    prediccion = cascada_categoria.predecir(descripcion_en)
+            if prediccion and cascada_categoria.es_confiable(prediccion[1]):
+                probabilidades = prediccion[2]
+                metodo = f"lineal:{cascada_categoria.version}"
+            else:
+                if classifier is None:
+                    raise RuntimeError("Clasificador zero-shot no disponible")
+                # Añadir contexto adicional para mejorar la clasificación
+                context = f"This is a description of a street furniture issue: {descripcion_en}"
+
+                # Obtener clasificación del modelo
+                with span("zero_shot", tarea="categoria"):
+                    result = classifier(context, candidate_labels=categorias)
+                probabilidades = dict(zip(result['labels'], result['scores']))
+
+            # Ajustar probabilidades basado en metadatos
+            if campos['ID']:
+                id_prefix = campos['ID'][0].upper()
+                if id_prefix == 'F':
+                    probabilidades['Farola'] = min(1.0, probabilidades.get('Farola', 0) + 0.3)
+                elif id_prefix == 'B':
+                    probabilidades['Banco'] = min(1.0, probabilidades.get('Banco', 0) + 0.3)
+                elif id_prefix == 'P':
+                    probabilidades['Papelera'] = min(1.0, probabilidades.get('Papelera', 0) + 0.3)
+                elif id_prefix == 'C':
+                    probabilidades['Contenedor'] = min(1.0, probabilidades.get('Contenedor', 0) + 0.3)
+                elif id_prefix == 'S':
+                    probabilidades['Señalización'] = min(1.0, probabilidades.get('Señalización', 0) + 0.3)
+
+            # Ajustar basado en el tipo
+            if campos['Tipo']:
+                tipo = campos['Tipo'].lower()
+                if 'farola' in tipo or 'lamp' in tipo or 'led' in tipo:
+                    probabilidades['Farola'] = min(1.0, probabilidades.get('Farola', 0) + 0.3)
+                elif 'banco' in tipo or 'bench' in tipo:
+                    probabilidades['Banco'] = min(1.0, probabilidades.get('Banco', 0) + 0.3)
+                elif 'papelera' in tipo or 'trash' in tipo:
+                    probabilidades['Papelera'] = min(1.0, probabilidades.get('Papelera', 0) + 0.3)
+                elif 'contenedor' in tipo or 'bin' in tipo:
+                    probabilidades['Contenedor'] = min(1.0, probabilidades.get('Contenedor', 0) + 0.3)
+                elif 'señal' in tipo or 'sign' in tipo:
+                    probabilidades['Señalización'] = min(1.0, probabilidades.get('Señalización', 0) + 0.3)
+
+            # Seleccionar la categoría con mayor probabilidad
+            categoria = max(probabilidades.items(), key=lambda x: x[1])[0]
+            log_evento("Clasificación completada", categoria=categoria, metodo=metodo,
+                       probabilidades=probabilidades)
+        except Exception as e:
+            st.warning(f"Error en la clasificación: {str(e)}. Usando categoría por defecto.")
+            metodo = "heurística"
+            log_evento("Error en la clasificación", logging.WARNING, error=str(e))
+            # Fallback heurístico mejorado
+            descripcion_lower = descripcion_input.lower()
+            # Palabras clave para farolas
+            farola_keywords = ["farola", "streetlight", "lamp", "luz", "iluminación", "poste", "poste de luz", 
+                             "lámpara", "luminaria", "alumbrado", "farol", "farolillo", "luz pública"]
+            # Palabras clave para otros elementos
+            banco_keywords = ["banco", "bench", "asiento", "banca"]
+            papelera_keywords = ["papelera", "trash", "basura", "contenedor", "waste", "litter"]
+            señal_keywords = ["señal", "sign", "señalización", "traffic", "tráfico", "semáforo"]
+            contenedor_keywords = ["contenedor", "bin", "container", "reciclaje", "recycling"]
+
+            # Contar coincidencias para cada categoría
+            farola_count = sum(1 for word in farola_keywords if word in descripcion_lower)
+            banco_count = sum(1 for word in banco_keywords if word in descripcion_lower)
+            papelera_count = sum(1 for word in papelera_keywords if word in descripcion_lower)
+            señal_count = sum(1 for word in señal_keywords if word in descripcion_lower)
+            contenedor_count = sum(1 for word in contenedor_keywords if word in descripcion_lower)
+
+            # Asignar la categoría con más coincidencias
+            counts = {
+                "Farola": farola_count,
+                "Banco": banco_count,
+                "Papelera": papelera_count,
+                "Señalización": señal_count,
+                "Contenedor": contenedor_count
+            }
+
+            if max(counts.values()) > 0:
+                categoria = max(counts.items(), key=lambda x: x[1])[0]
+
+            log_evento("Categoría heurística asignada", categoria=categoria)
+
+        incidence_data = {
+            'ID': campos['ID'] or "No disponible",
+            'Ubicación': ubicacion,
+            'Municipio': municipio.id,
+            'Estado': campos['Estado'] or "No disponible",
+            'Fecha de instalación': campos['Fecha de instalación'] or "No disponible",
+            'Última revisión': campos['Última revisión'] or "No disponible",
+            'Tipo': campos['Tipo'] or "No disponible",
+            'Observaciones': campos['Observaciones'] or "No disponible",
+            'Descripción adicional (EN)': descripcion_en,
+            'Descripción adicional (ES)': descripcion_es,
+            'Texto Extraído': detected_text,
+            'Idioma detectado': idioma,
+            'Imagen': image_key,
+            'Miniatura': thumbnail_key,
+            'Timestamp': datetime.utcnow().isoformat(),
+            'Categoría': categoria,
+            'Probabilidades': probabilidades,
+            'Clasificador': metodo
+        }
+
+        # Guardar en el almacén del municipio (S3 o SQLite)
+        try:
+            with span("almacen.put_incident", municipio=municipio.id):
+                incidence_id = federacion.almacen(municipio).put_incident(incidence_data)
+            log_evento("Incidencia guardada", incidencia=incidence_id, categoria=categoria,
+                       municipio=municipio.id)
+            for evento in detector_hotspots(municipio.id).registrar(incidence_data):
+                log_evento("Hotspot detectado", logging.WARNING, **evento)
+            st.success(f"Incidencia reportada correctamente. Categoría asignada: {categoria}")
+            return incidence_data
+        except Exception as e:
+            st.error(f"Error al guardar la incidencia: {str(e)}")
+    else:
+        st.warning("Por favor, sube una foto de la etiqueta de la farola.")
+
 def reportar_incidencia():
     st.title("Reportar Incidencia")
     st.subheader("Captura una foto con la cámara o sube una foto de tu galería:")
@@ -292,9 +549,18 @@ def reportar_incidencia():
     ubicacion = st.text_input("Ubicación * (por ejemplo, Calle Sagasta, Madrid):")
     descripcion_input = st.text_area("Descripción adicional * (describe brevemente la incidencia, preferiblemente en inglés, pero se acepta español):")
 
+    # Con varios municipios se propone el de la ubicación, pero el ciudadano puede cambiarlo
+    municipio = None
+    if len(federacion) > 1:
+        opciones = list(federacion.municipios.values())
+        sugerido = federacion.resolver(ubicacion)
+        municipio = st.selectbox("Municipio *", opciones, index=opciones.index(sugerido),
+                                 format_func=lambda m: m.nombre)
+
 
     if st.button("Procesar Incidencia"):
-        print("Iniciando procesamiento de incidencia...")
+        nuevo_id_correlacion()
+        log_evento("Iniciando procesamiento de incidencia")
         image = picture if picture is not None else photo
 
         try:
@@ -304,190 +570,36 @@ def reportar_incidencia():
             if not ubicacion or not descripcion_input:
                 st.error("Ubicación y descripción son campos obligatorios.")
                 return
-            if classifier is None:
+            if classifier is None and cascada_categoria is None:
                 st.error("Clasificador no disponible. Verifica la configuración del modelo.")
                 return
 
             with st.spinner("Procesando la incidencia, espera un momento..."):
-                # Procesar imagen con Rekognition
-                print("Llamando a extract_text_from_image...")
-                try:
-                    detected_text = extract_text_from_image(image)
-                    print("Extracción de texto completada:", detected_text)
-                except Exception as e:
-                    st.error(f"Error al procesar la imagen con Rekognition: {str(e)}")
-                    return
-
-                if detected_text:
-                    # Extraer datos del texto detectado
-                    print("Analizando texto detectado...")
-                    id_match = re.search(r'ID:\s*([A-Z0-9-]+)', detected_text)
-                    state_match = re.search(r'Estado:\s*(\w+)', detected_text)
-                    installation_date_match = re.search(r'Fecha de instalación:\s*(\d{4}-\d{2}-\d{2})', detected_text)
-                    last_review_match = re.search(r'Última revisión:\s*(\d{4}-\d{2}-\d{2})', detected_text)
-                    type_match = re.search(r'Tipo:\s*(.+)', detected_text)
-                    observations_match = re.search(r'Observaciones:\s*(.+)', detected_text)
-
-                    # Traducir descripción al español (si es necesario) y al inglés para clasificación
-                    print("Traduciendo descripción...")
-                    descripcion_es = descripcion_input
-                    descripcion_en = descripcion_input
-                    try:
-                        # Traducir de español a español (si ya está en español, no hace nada)
-                        descripcion_es = traducir_texto(descripcion_input, model, tokenizer) if model and tokenizer else descripcion_input
-                        # Traducir de español a inglés para el clasificador
-                        en_trans_model_name = "Helsinki-NLP/opus-mt-es-en"
-                        en_tokenizer = MarianTokenizer.from_pretrained(en_trans_model_name)
-                        en_model = MarianMTModel.from_pretrained(en_trans_model_name)
-                        en_model = en_model.to("cpu")  # Forzar CPU
-                        batch = en_tokenizer([descripcion_input], return_tensors="pt", padding=True)
-                        translated = en_model.generate(**batch)
-                        descripcion_en = en_tokenizer.batch_decode(translated, skip_special_tokens=True)[0]
-                        print("Traducción completada - Español:", descripcion_es, "Inglés:", descripcion_en)
-                    except Exception as e:
-                        st.warning(f"Error en la traducción: {e}. Usando descripción original.")
-                        print(f"Error en la traducción: {str(e)}")
-                        descripcion_es = descripcion_input
-                        descripcion_en = descripcion_input
-
-                    # Clasificación automática de la categoría
-                    categorias = ["Farola", "Banco", "Papelera","Contenedor", "Señalización", "Otros"]
-                    categoria = "Otros"  # Fallback por defecto
-                    probabilidades = {}
-                    print("Ejecutando clasificación zero-shot con input:", descripcion_en)
-                    try:
-                        # Añadir contexto adicional para mejorar la clasificación
-                        context = f"This is a description of a street furniture issue: {descripcion_en}"
-                        
-                        # Obtener clasificación del modelo
-                        result = classifier(context, candidate_labels=categorias)
-                        probabilidades = dict(zip(result['labels'], result['scores']))
-                        
-                        # Ajustar probabilidades basado en metadatos
-                        if id_match and id_match.group(1):
-                            id_prefix = id_match.group(1)[0].upper()
-                            if id_prefix == 'F':
-                                probabilidades['Farola'] = min(1.0, probabilidades.get('Farola', 0) + 0.3)
-                            elif id_prefix == 'B':
-                                probabilidades['Banco'] = min(1.0, probabilidades.get('Banco', 0) + 0.3)
-                            elif id_prefix == 'P':
-                                probabilidades['Papelera'] = min(1.0, probabilidades.get('Papelera', 0) + 0.3)
-                            elif id_prefix == 'C':
-                                probabilidades['Contenedor'] = min(1.0, probabilidades.get('Contenedor', 0) + 0.3)
-                            elif id_prefix == 'S':
-                                probabilidades['Señalización'] = min(1.0, probabilidades.get('Señalización', 0) + 0.3)
-                        
-                        # Ajustar basado en el tipo
-                        if type_match and type_match.group(1):
-                            tipo = type_match.group(1).lower()
-                            if 'farola' in tipo or 'lamp' in tipo or 'led' in tipo:
-                                probabilidades['Farola'] = min(1.0, probabilidades.get('Farola', 0) + 0.3)
-                            elif 'banco' in tipo or 'bench' in tipo:
-                                probabilidades['Banco'] = min(1.0, probabilidades.get('Banco', 0) + 0.3)
-                            elif 'papelera' in tipo or 'trash' in tipo:
-                                probabilidades['Papelera'] = min(1.0, probabilidades.get('Papelera', 0) + 0.3)
-                            elif 'contenedor' in tipo or 'bin' in tipo:
-                                probabilidades['Contenedor'] = min(1.0, probabilidades.get('Contenedor', 0) + 0.3)
-                            elif 'señal' in tipo or 'sign' in tipo:
-                                probabilidades['Señalización'] = min(1.0, probabilidades.get('Señalización', 0) + 0.3)
-                        
-                        # Seleccionar la categoría con mayor probabilidad
-                        categoria = max(probabilidades.items(), key=lambda x: x[1])[0]
-                        print("Clasificación completada:", categoria, probabilidades)
-                    except Exception as e:
-                        st.warning(f"Error en la clasificación: {str(e)}. Usando categoría por defecto.")
-                        print(f"Error en la clasificación: {str(e)}")
-                        # Fallback heurístico mejorado
-                        descripcion_lower = descripcion_input.lower()
-                        # Palabras clave para farolas
-                        farola_keywords = ["farola", "streetlight", "lamp", "luz", "iluminación", "poste", "poste de luz", 
-                                         "lámpara", "luminaria", "alumbrado", "farol", "farolillo", "luz pública"]
-                        # Palabras clave para otros elementos
-                        banco_keywords = ["banco", "bench", "asiento", "banca"]
-                        papelera_keywords = ["papelera", "trash", "basura", "contenedor", "waste", "litter"]
-                        señal_keywords = ["señal", "sign", "señalización", "traffic", "tráfico", "semáforo"]
-                        contenedor_keywords = ["contenedor", "bin", "container", "reciclaje", "recycling"]
-
-                        # Contar coincidencias para cada categoría
-                        farola_count = sum(1 for word in farola_keywords if word in descripcion_lower)
-                        banco_count = sum(1 for word in banco_keywords if word in descripcion_lower)
-                        papelera_count = sum(1 for word in papelera_keywords if word in descripcion_lower)
-                        señal_count = sum(1 for word in señal_keywords if word in descripcion_lower)
-                        contenedor_count = sum(1 for word in contenedor_keywords if word in descripcion_lower)
-
-                        # Asignar la categoría con más coincidencias
-                        counts = {
-                            "Farola": farola_count,
-                            "Banco": banco_count,
-                            "Papelera": papelera_count,
-                            "Señalización": señal_count,
-                            "Contenedor": contenedor_count
-                        }
-                        
-                        if max(counts.values()) > 0:
-                            categoria = max(counts.items(), key=lambda x: x[1])[0]
-                        
-                        print("Categoría heurística asignada:", categoria)
-
-                    incidence_data = {
-                        'ID': id_match.group(1) if id_match else "No disponible",
-                        'Ubicación': ubicacion,
-                        'Estado': state_match.group(1) if state_match else "No disponible",
-                        'Fecha de instalación': installation_date_match.group(1) if installation_date_match else "No disponible",
-                        'Última revisión': last_review_match.group(1) if last_review_match else "No disponible",
-                        'Tipo': type_match.group(1) if type_match else "No disponible",
-                        'Observaciones': observations_match.group(1) if observations_match else "No disponible",
-                        'Descripción adicional (EN)': descripcion_en,
-                        'Descripción adicional (ES)': descripcion_es,
-                        'Texto Extraído': detected_text,
-                        'Timestamp': datetime.utcnow().isoformat(),
-                        'Categoría': categoria,
-                        'Probabilidades': probabilidades
-                    }
-
-                    # Guardar en S3
-                    print("Subiendo a S3...")
-                    try:
-                        incidence_id = str(uuid.uuid4())
-                        s3.put_object(
-                            Bucket=bucket_name,
-                            Key=f"incidencias/{incidence_id}.json",
-                            Body=json.dumps(incidence_data)
-                        )
-                        print("Subida a S3 completada.")
-                        st.success(f"Incidencia reportada correctamente. Categoría asignada: {categoria}")
-                    except Exception as e:
-                        st.error(f"Error al guardar en S3: {str(e)}")
-                else:
-                    st.warning("Por favor, sube una foto de la etiqueta de la farola.")
+                procesar_incidencia(image, ubicacion, descripcion_input, municipio)
         except Exception as e:
             st.error(f"Error general al procesar la incidencia: {str(e)}")
-            print(f"Error general: {str(e)}")
+            log_evento("Error general", logging.ERROR, error=str(e))
             
 # Página de "Ver Incidencias"
 def ver_incidencias():
     st.title("Ver Incidencias - Técnico")
+
+    # Hotspots vigentes: salen del detector en memoria, sin recorrer el histórico
+    municipio = municipio_actual()
+    hotspots = detector_hotspots(municipio.id).hotspots_activos()
+    if hotspots:
+        st.subheader("🔥 Hotspots activos")
+        for h in hotspots:
+            nombre = h["clave"].title() if h["tipo"] == "calle" else f"Activo {h['clave']}"
+            st.markdown(f"- **{nombre}**: {h['reportes']} incidencias recientes (z={h['z']}) desde {h['desde'][:16]}")
+        st.markdown("---")
     
     categorias = ["Todas", "Farola", "Banco", "Papelera", "Contenedor", "Señalización", "Otros"]
     categoria_filtro = st.selectbox("Filtrar por categoría:", categorias)
+    texto = st.text_input("Buscar en las descripciones:")
     
     try:
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix="incidencias/")
-        incidences = []
-
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                if obj['Key'].endswith('.json'):
-                    metadata_obj = s3.get_object(Bucket=bucket_name, Key=obj['Key'])
-                    metadata_content = metadata_obj['Body'].read().decode('utf-8')
-                    if metadata_content.strip():
-                        metadata = json.loads(metadata_content)
-                        # Ensure 'Categoría' exists, default to 'Desconocida' if missing
-                        if 'Categoría' not in metadata or not metadata['Categoría']:
-                            metadata['Categoría'] = 'Desconocida'
-                        # Only include if category matches filter (or "Todas")
-                        if categoria_filtro == "Todas" or metadata['Categoría'] == categoria_filtro:
-                            incidences.append(metadata)
+        incidences = cargar_incidencias(None if categoria_filtro == "Todas" else categoria_filtro, texto=texto)
 
         if incidences:
             
@@ -505,8 +617,15 @@ def ver_incidencias():
                 st.markdown("---")
             # — Fin agrupamiento automático — 
                 
-            for inc in sorted(incidences, key=lambda x: x.get('Timestamp', ''), reverse=True):
+            for inc in incidences:
                 with st.expander(f"🆔 ID: {inc.get('ID', 'No disponible')} | 📍 {inc.get('Ubicación', 'No disponible')} | 📌 Categoría: {inc.get('Categoría', 'No disponible')}"):
+                    # Ni la miniatura ni la foto pasan por el servidor: el navegador pide la
+                    # miniatura a S3 sólo cuando se abre el desplegable (loading="lazy")
+                    if inc.get('Miniatura'):
+                        st.markdown(f'<img src="{escape(url_prefirmada(municipio.id, inc["Miniatura"]))}" '
+                                    f'width="240" loading="lazy">', unsafe_allow_html=True)
+                    if inc.get('Imagen'):
+                        st.markdown(f"[🔍 Ver foto original]({url_prefirmada(municipio.id, inc['Imagen'])})")
                     st.markdown(f"**📍 Ubicación:** {inc.get('Ubicación', 'No disponible')}")
                     st.markdown(f"**🔧 Estado:** {inc.get('Estado', 'No disponible')}")
                     st.markdown(f"**📅 Fecha de instalación:** {inc.get('Fecha de instalación', 'No disponible')}")
@@ -516,6 +635,7 @@ def ver_incidencias():
                     st.markdown(f"**🗒️ Descripción en inglés:** {inc.get('Descripción adicional (EN)', 'No disponible')}")
                     st.markdown(f"**🗒️ Descripción traducida al español:** {inc.get('Descripción adicional (ES)', 'No disponible')}")
                     st.markdown(f"**📷 Texto extraído:** `{inc.get('Texto Extraído', '')}`")
+                    st.markdown(f"**🌐 Idioma detectado:** {inc.get('Idioma detectado', 'No disponible')}")
                     st.markdown(f"**📊 Probabilidades por categoría:** {inc.get('Probabilidades', 'No disponible')}")
                     st.caption(f"🕒 Reportado: {inc.get('Timestamp', '')}")
                    
@@ -524,40 +644,82 @@ def ver_incidencias():
     except Exception as e:
         st.error(f"Error al cargar incidencias: {str(e)}")
 
+def filtros_incidencias(categoria=None, desde=None, hasta=None, texto=None):
+    # Filtros para el almacén (ver almacenamiento.py); los vacíos no se envían
+    filtros = {"categoria": categoria, "desde": desde, "hasta": hasta, "texto": texto}
+    return {k: v for k, v in filtros.items() if v}
+
+def cargar_incidencias(categoria=None, desde=None, hasta=None, texto=None, limite=None):
+    # Incidencias del municipio actual, de la más reciente a la más antigua
+    municipio = municipio_actual()
+    with span("almacen.query", categoria=categoria or "Todas", municipio=municipio.id):
+        incidencias, _ = federacion.almacen(municipio).query(
+            filtros_incidencias(categoria, desde, hasta, texto), limit=limite)
+        return incidencias
+
+def seccion_exportar(categoria, desde=None, hasta=None):
+    # Exportación completa en streaming desde S3, sin pasar por el DataFrame de la página
+    with st.expander("⬇️ Exportar incidencias"):
+        col1, col2, col3 = st.columns(3)
+        formato = col1.radio("Formato", ["csv", "parquet"], horizontal=True)
+        desde = col2.date_input("Desde", value=desde, key="exportar_desde")
+        hasta = col3.date_input("Hasta", value=hasta, key="exportar_hasta")
+        calle = st.text_input("Calle (opcional)")
+        if st.button("Generar exportación"):
+            municipio = municipio_actual()
+            estado = st.empty()
+            # El directorio temporal se borra al terminar, se haya servido o no el fichero
+            with tempfile.TemporaryDirectory() as directorio:
+                destino = os.path.join(directorio, f"incidencias.{formato}")
+                with span("exportar", formato=formato):
+                    resumen = exportar(
+                        federacion.almacen(municipio), destino, formato, categoria,
+                        desde.isoformat() if desde else None, hasta.isoformat() if hasta else None,
+                        calle or None,
+                        progreso=lambda leidas, exportadas: estado.text(f"{leidas} leídas, {exportadas} exportadas...")
+                    )
+                estado.success(f"{resumen['filas']} incidencias exportadas en {resumen['segundos']:.1f} s")
+                nombre = os.path.basename(destino)
+                if os.path.getsize(destino) <= MAX_EXPORTACION_UI:
+                    with open(destino, "rb") as f:
+                        st.download_button("Descargar", f.read(), file_name=nombre,
+                                           mime="text/csv" if formato == "csv" else "application/octet-stream")
+                else:
+                    # upload_fileobj sube el fichero por partes, sin leerlo entero en memoria
+                    clave = f"exportaciones/{uuid.uuid4()}/{nombre}"
+                    with span("s3.upload_fileobj"), open(destino, "rb") as f:
+                        federacion.s3(municipio).upload_fileobj(f, municipio.bucket, clave)
+                    st.markdown(f"La exportación es demasiado grande para servirla desde aquí: "
+                                f"[⬇️ Descargar desde S3]({url_prefirmada(municipio.id, clave)}) "
+                                f"(o usa `python exportar.py`).")
+
 def pagina_estadisticas():
     st.title("📊 Estadísticas de Incidencias")
 
     try:
-        # Fetch incidencias
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix="incidencias/")
-        incidences = []
-
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                if obj['Key'].endswith('.json'):
-                    metadata_obj = s3.get_object(Bucket=bucket_name, Key=obj['Key'])
-                    metadata_content = metadata_obj['Body'].read().decode('utf-8')
-                    if metadata_content.strip():
-                        metadata = json.loads(metadata_content)
-                        if 'Categoría' not in metadata or not metadata['Categoría']:
-                            metadata['Categoría'] = 'Desconocida'
-                        incidences.append(metadata)
-
-        if not incidences:
-            st.info("No hay incidencias para mostrar estadísticas.")
-            return
-
-        # Crear DataFrame
-        df = pd.DataFrame(incidences)
-
-        # Filtro de categoría
-        categorias = ["Todas"] + sorted(df['Categoría'].unique())
-        categoria_filtro = st.selectbox("Filtrar por categoría:", categorias)
-
-        filtered_df = df if categoria_filtro == "Todas" else df[df['Categoría'] == categoria_filtro]
-
-        if filtered_df.empty:
-            st.info(f"No hay incidencias para la categoría '{categoria_filtro}'.")
+        # Los filtros se eligen antes de cargar para no descargar particiones que no hacen falta
+        col_cat, col_desde, col_hasta = st.columns(3)
+        categorias = ["Todas", "Farola", "Banco", "Papelera", "Contenedor", "Señalización", "Otros", "Desconocida"]
+        categoria_filtro = col_cat.selectbox("Filtrar por categoría:", categorias)
+        desde = col_desde.date_input("Desde", value=None)
+        hasta = col_hasta.date_input("Hasta", value=None)
+        categoria = None if categoria_filtro == "Todas" else categoria_filtro
+
+        seccion_exportar(categoria, desde, hasta)
+
+        desde = desde.isoformat() if desde else None
+        hasta = hasta.isoformat() if hasta else None
+        # Conteos para las gráficas y las más recientes para el listado, en una sola consulta
+        # al almacén y sin cargar todas las incidencias
+        max_display = 10
+        municipio = municipio_actual()
+        with span("almacen.resumen", municipio=municipio.id):
+            conteos, recientes = federacion.almacen(municipio).resumen(
+                ["Categoría", "Estado"], filtros_incidencias(categoria, desde, hasta), limit=max_display)
+        total = sum(conteos["Categoría"].values())
+
+        if not total:
+            st.info(f"No hay incidencias para la categoría '{categoria_filtro}' en las fechas seleccionadas.")
             return
 
         # Crear dos columnas para las gráficas
@@ -566,7 +728,7 @@ def pagina_estadisticas():
         with col1:
             st.subheader("📈 Distribución por Categoría")
             # Gráfico de barras
-            categoria_counts = filtered_df['Categoría'].value_counts().to_dict()
+            categoria_counts = dict(conteos["Categoría"].most_common())
             labels = list(categoria_counts.keys())
             values = list(categoria_counts.values())
             
@@ -615,7 +777,7 @@ def pagina_estadisticas():
         with col2:
             st.subheader("🍩 Estado de Incidencias")
             # Gráfico circular
-            estado_counts = filtered_df['Estado'].value_counts().to_dict()
+            estado_counts = dict(conteos["Estado"].most_common())
             labels = list(estado_counts.keys())
             values = list(estado_counts.values())
             
@@ -666,10 +828,7 @@ def pagina_estadisticas():
 
         # Listado de incidencias
         st.subheader("📋 Listado de Incidencias")
-        max_display = 10
-        for idx, inc in enumerate(
-            sorted(filtered_df.to_dict('records'), key=lambda x: x.get('Timestamp', ''), reverse=True)[:max_display]
-        ):
+        for idx, inc in enumerate(recientes):
             with st.expander(f"🆔 ID: {inc.get('ID', 'No disponible')} | 📍 {inc.get('Ubicación', 'No disponible')} | 📌 {inc.get('Categoría', 'No disponible')}"):
                 st.markdown(f"📍 **Ubicación:** {inc.get('Ubicación', 'No disponible')}")
                 st.markdown(f"🔧 **Estado:** {inc.get('Estado', 'No disponible')}")
@@ -682,12 +841,61 @@ def pagina_estadisticas():
                 st.markdown(f"📷 **Texto extraído:** {inc.get('Texto Extraído', '')}")
                 st.caption(f"🕒 Reportado: {inc.get('Timestamp', '')}")
 
-        if len(filtered_df) > max_display:
-            st.info(f"Mostrando {max_display} de {len(filtered_df)} incidencias. Filtra por categoría para ver más detalles.")
+        if total > max_display:
+            st.info(f"Mostrando {max_display} de {total} incidencias. Filtra por categoría para ver más detalles.")
 
     except Exception as e:
         st.error(f"Error al generar estadísticas: {str(e)}")
-        print(f"Statistics error: {str(e)}")
+        log_evento("Statistics error", logging.ERROR, error=str(e))
+
+# Vista regional: todos los municipios consultados a la vez
+def pagina_regional():
+    st.title("🗺️ Vista Regional")
+
+    col_cat, col_desde, col_hasta = st.columns(3)
+    categorias = ["Todas", "Farola", "Banco", "Papelera", "Contenedor", "Señalización", "Otros", "Desconocida"]
+    categoria_filtro = col_cat.selectbox("Filtrar por categoría:", categorias, key="regional_categoria")
+    desde = col_desde.date_input("Desde", value=None, key="regional_desde")
+    hasta = col_hasta.date_input("Hasta", value=None, key="regional_hasta")
+
+    try:
+        with st.spinner("Consultando los municipios..."), span("vista_regional"):
+            vista = vista_regional(federacion, None if categoria_filtro == "Todas" else categoria_filtro,
+                                   desde.isoformat() if desde else None, hasta.isoformat() if hasta else None)
+    except Exception as e:
+        st.error(f"Error al consultar los municipios: {str(e)}")
+        log_evento("Regional overview error", logging.ERROR, error=str(e))
+        return
+
+    estados = {"ok": "✅ Respondió", "timeout": "⏱️ Sin respuesta a tiempo", "error": "❌ Error"}
+    filas = []
+    for municipio_id, r in vista["municipios"].items():
+        if r["estado"] != "ok":
+            log_evento("Municipio sin datos en la vista regional", logging.WARNING,
+                       municipio=municipio_id, estado=r["estado"], error=r.get("error"))
+        filas.append({
+            "Municipio": federacion.municipios[municipio_id].nombre,
+            "Estado": estados[r["estado"]],
+            "Incidencias": sum(r["resultado"]["Categoría"].values()) if r["estado"] == "ok" else None,
+            "Última": max((f for f in r["resultado"]["fecha"] if f != "No disponible"), default="") if r["estado"] == "ok" else "",
+            "Segundos": round(r["segundos"], 2),
+        })
+    if not vista["completo"]:
+        st.warning("Resultados parciales: algunos municipios no han respondido y no se incluyen en los totales.")
+
+    combinado = vista["combinado"]
+    st.metric("Incidencias en la región", sum(combinado["Categoría"].values()))
+    st.dataframe(pd.DataFrame(filas), hide_index=True, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📈 Distribución por Categoría")
+        if combinado["Categoría"]:
+            st.bar_chart(pd.Series(dict(combinado["Categoría"].most_common()), name="Incidencias"))
+    with col2:
+        st.subheader("🍩 Estado de Incidencias")
+        if combinado["Estado"]:
+            st.bar_chart(pd.Series(dict(combinado["Estado"].most_common()), name="Incidencias"))
 
 # Página del Chatbot
 def chatbot_page():
@@ -705,11 +913,12 @@ def chatbot_page():
         messages = st.session_state.chat_history.copy()
 
         try:
-            response = requests.post(
-                "http://localhost:11434/api/chat",
-                json={"model": "llama3:latest", "messages": messages, "stream": False},
-                timeout=30
-            )
+            with span("ollama.chat"):
+                response = requests.post(
+                    "http://localhost:11434/api/chat",
+                    json={"model": "llama3:latest", "messages": messages, "stream": False},
+                    timeout=30
+                )
 
             if response.status_code == 200:
                 try:
@@ -764,6 +973,12 @@ def main():
         else:
             st.warning("Por favor, inicia sesión para ver estadísticas.")
             login()
+    elif selected_page == "Vista Regional":
+        if st.session_state.get("authenticated"):
+            pagina_regional()
+        else:
+            st.warning("Por favor, inicia sesión para ver la vista regional.")
+            login()
     elif selected_page == "Chatbot":
         chatbot_page()
 
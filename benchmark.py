@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks de las rutas principales de UrbanEye sobre incidencias sintéticas.
+
+Uso:
+    python benchmark.py                              # 1k, 10k y 100k incidencias
+    python benchmark.py --tamanos 1000 1000000       # incluir el caso de 1M
+    python benchmark.py --comparar bench_results/abc1234.json
+
+Los resultados se guardan en JSON (por defecto bench_results/<commit>.json) para
+poder comparar dos commits.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import security_alerts
+from almacenamiento import AlmacenS3, AlmacenSQLite
+from label_parsing import extraer_campos_etiqueta
+from local_s3 import LocalS3Client
+from street_bundling import normalize_street, group_by_street
+from synthetic_incidents import generar_incidencias
+
+TAMANOS_POR_DEFECTO = [1_000, 10_000, 100_000]
+DIRECTORIO_RESULTADOS = Path("bench_results")
+# Una ruta se marca como regresión si su mediana empeora más de este factor
+UMBRAL_REGRESION = 1.10
+
+
+class _ClasificadorFalso:
+    """Sustituye al pipeline zero-shot para medir sólo el código propio."""
+
+    def __call__(self, text, candidate_labels):
+        return {"labels": list(candidate_labels), "scores": [0.4] + [0.12] * (len(candidate_labels) - 1)}
+
+
+def _bench_normalize_street(incidencias):
+    calles = [inc['Ubicación'].split(",")[0] for inc in incidencias]
+    return lambda: [normalize_street(c) for c in calles]
+
+
+def _bench_group_by_street(incidencias):
+    return lambda: group_by_street(incidencias)
+
+
+def _bench_classify_and_alert(incidencias):
+    # classify_and_alert modifica el dict, así que se trabaja sobre copias
+    copias = [dict(inc) for inc in incidencias]
+    return lambda: [security_alerts.classify_and_alert(inc) for inc in copias]
+
+
+def _bench_extraer_campos_etiqueta(incidencias):
+    textos = [inc['Texto Extraído'] for inc in incidencias]
+    return lambda: [extraer_campos_etiqueta(t) for t in textos]
+
+
+def _resumen(almacen):
+    # Misma consulta que pagina_estadisticas() sin filtros
+    return lambda: almacen.resumen(["Categoría", "Estado"], {}, limit=10)
+
+
+def _bench_resumen_sqlite(incidencias):
+    almacen = AlmacenSQLite(":memory:")
+    almacen.put_many((str(i), inc) for i, inc in enumerate(incidencias))
+    return _resumen(almacen)
+
+
+def _bench_resumen_s3(incidencias):
+    # S3 local en memoria y sin latencia: se mide el código propio, no la red
+    almacen = AlmacenS3(LocalS3Client(), "benchmark")
+    for i, inc in enumerate(incidencias):
+        almacen.put_incident(inc, str(i))
+    return _resumen(almacen)
+
+
+BENCHMARKS = {
+    "normalize_street": _bench_normalize_street,
+    "group_by_street": _bench_group_by_street,
+    "classify_and_alert": _bench_classify_and_alert,
+    "extraer_campos_etiqueta": _bench_extraer_campos_etiqueta,
+    "resumen_sqlite": _bench_resumen_sqlite,
+    "resumen_s3": _bench_resumen_s3,
+}
+
+
+def _medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def _commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "desconocido"
+
+
+def ejecutar(tamanos, repeticiones, seleccion=None, semilla=0):
+    security_alerts._classifier = _ClasificadorFalso()
+    # Sin modelo lineal: se mide siempre la misma ruta (palabras clave + zero-shot falso)
+    security_alerts._cascada = False
+    # Sin alertas reales: con SLACK_WEBHOOK_URL configurado se enviaría un POST por cada
+    # incidencia sintética de nivel medio o alto y se mediría la latencia de la red
+    security_alerts.SLACK_WEBHOOK = ""
+    resultados = []
+    for n in tamanos:
+        print(f"Generando {n} incidencias sintéticas...")
+        incidencias = generar_incidencias(n, semilla)
+        for nombre, preparar in BENCHMARKS.items():
+            if seleccion and nombre not in seleccion:
+                continue
+            fn = preparar(incidencias)
+            # Una ejecución de calentamiento antes de medir
+            fn()
+            tiempos = _medir(fn, repeticiones)
+            mediana = statistics.median(tiempos)
+            resultados.append({
+                "benchmark": nombre,
+                "n": n,
+                "repeticiones": repeticiones,
+                "min_s": min(tiempos),
+                "mediana_s": mediana,
+                "max_s": max(tiempos),
+                "us_por_incidencia": mediana / n * 1e6,
+            })
+            print(f"  {nombre:<26} n={n:<9} mediana={mediana * 1000:10.2f} ms "
+                  f"({mediana / n * 1e6:.2f} µs/incidencia)")
+        del incidencias
+    return resultados
+
+
+def comparar(actuales, anteriores, umbral=UMBRAL_REGRESION):
+    """
+    Compara dos ejecuciones y devuelve las rutas cuya mediana empeora más del umbral.
+    """
+    previos = {(r["benchmark"], r["n"]): r for r in anteriores["resultados"]}
+    regresiones = []
+    print(f"\nComparación con {anteriores.get('commit', '?')}:")
+    for r in actuales:
+        previo = previos.get((r["benchmark"], r["n"]))
+        if not previo:
+            continue
+        ratio = r["mediana_s"] / previo["mediana_s"] if previo["mediana_s"] else float("inf")
+        marca = "  <-- REGRESIÓN" if ratio > umbral else ""
+        print(f"  {r['benchmark']:<26} n={r['n']:<9} x{ratio:.2f}{marca}")
+        if ratio > umbral:
+            regresiones.append({**r, "ratio": ratio})
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de UrbanEye")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS_POR_DEFECTO,
+                        help="Número de incidencias sintéticas por caso")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--solo", nargs="+", choices=sorted(BENCHMARKS),
+                        help="Ejecutar sólo estos benchmarks")
+    parser.add_argument("--salida", type=Path,
+                        help="Fichero JSON de resultados (por defecto bench_results/<commit>.json)")
+    parser.add_argument("--comparar", type=Path,
+                        help="JSON de una ejecución anterior contra el que comparar")
+    args = parser.parse_args(argv)
+
+    commit = _commit_actual()
+    resultados = ejecutar(args.tamanos, args.repeticiones, args.solo, args.semilla)
+
+    salida = args.salida or DIRECTORIO_RESULTADOS / f"{commit}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "fecha": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "semilla": args.semilla,
+            "resultados": resultados,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = json.load(f)
+        if comparar(resultados, anteriores):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Clasificador en cascada: un modelo lineal barato responde primero y el zero-shot
+(distilbart-mnli) sólo se usa cuando su confianza no supera el umbral.
+
+El modelo lineal (n-gramas con hashing + regresión logística multinomial) se entrena
+offline con las etiquetas que ya asignó el zero-shot a las incidencias guardadas:
+
+    python cascade_classifier.py entrenar --tarea categoria
+    python cascade_classifier.py entrenar --tarea seguridad --umbral 0.85
+    python cascade_classifier.py evaluar --tarea categoria --jsonl incidencias.jsonl
+
+Cada entrenamiento guarda una versión nueva en models/<tarea>-<version>.json y el
+servidor carga la más reciente.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import unicodedata
+import zlib
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+MODELOS_DIR = Path(os.getenv("URBANEYE_MODELOS_DIR", "models"))
+DIMENSION = 2 ** 18
+UMBRAL_POR_DEFECTO = 0.9
+UMBRALES_INFORME = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99)
+
+
+def texto_categoria(inc):
+    # Mismo texto que recibe el zero-shot en reportar_incidencia()
+    return inc.get("Descripción adicional (EN)", "") or ""
+
+
+def texto_seguridad(inc):
+    # Mismo texto que usa classify_and_alert()
+    return (inc.get("Descripción adicional (ES)", "") or inc.get("Descripción adicional (EN)", "")
+            or inc.get("Texto Extraído", "") or "")
+
+
+# tarea → (función que extrae el texto, campo con la etiqueta, campo con quién la asignó)
+TAREAS = {
+    "categoria": (texto_categoria, "Categoría", "Clasificador"),
+    "seguridad": (texto_seguridad, "security_label", "security_classifier"),
+}
+# Sólo las etiquetas del zero-shot sirven de referencia; las incidencias anteriores a la
+# cascada no tienen el campo y también las asignó el zero-shot
+ORIGEN_ETIQUETAS = "zero-shot"
+
+_PALABRA = re.compile(r"\w+")
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def _hash(token):
+    return zlib.crc32(token.encode("utf-8")) % DIMENSION
+
+
+def caracteristicas(texto):
+    """
+    Índices (con hashing) de palabras, bigramas de palabras y trigramas de caracteres,
+    con valor 1/sqrt(n) para que textos largos y cortos tengan la misma norma.
+    """
+    palabras = _PALABRA.findall(_normalizar(texto))
+    tokens = [f"w:{p}" for p in palabras]
+    tokens += [f"b:{a}_{b}" for a, b in zip(palabras, palabras[1:])]
+    for p in palabras:
+        p = f"<{p}>"
+        tokens += [f"c:{p[i:i + 3]}" for i in range(len(p) - 2)]
+    if not tokens:
+        return {}
+    conteo = Counter(_hash(t) for t in tokens)
+    norma = math.sqrt(sum(n * n for n in conteo.values()))
+    return {idx: n / norma for idx, n in conteo.items()}
+
+
+def _softmax(valores):
+    m = max(valores)
+    exps = [math.exp(v - m) for v in valores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class ClasificadorLineal:
+    """Regresión logística multinomial sobre características con hashing (pesos dispersos)."""
+
+    def __init__(self, tarea, clases, pesos=None, sesgos=None, umbral=UMBRAL_POR_DEFECTO,
+                 version=None, metricas=None):
+        self.tarea = tarea
+        self.clases = list(clases)
+        self.pesos = pesos if pesos is not None else {}
+        self.sesgos = sesgos if sesgos is not None else [0.0] * len(self.clases)
+        self.umbral = umbral
+        self.version = version
+        self.metricas = metricas or {}
+
+    def _puntuaciones(self, x):
+        z = list(self.sesgos)
+        for idx, valor in x.items():
+            w = self.pesos.get(idx)
+            if w is not None:
+                for k, wk in enumerate(w):
+                    z[k] += wk * valor
+        return z
+
+    def probabilidades(self, texto):
+        return dict(zip(self.clases, _softmax(self._puntuaciones(caracteristicas(texto)))))
+
+    def predecir(self, texto):
+        """
+        Devuelve (etiqueta, confianza, probabilidades) para el texto.
+        """
+        probs = self.probabilidades(texto)
+        etiqueta = max(probs, key=probs.get)
+        return etiqueta, probs[etiqueta], probs
+
+    def es_confiable(self, confianza):
+        return confianza >= self.umbral
+
+    @classmethod
+    def entrenar(cls, tarea, textos, etiquetas, epocas=10, tasa=0.5, semilla=0, umbral=UMBRAL_POR_DEFECTO):
+        clases = sorted(set(etiquetas))
+        indice = {c: k for k, c in enumerate(clases)}
+        modelo = cls(tarea, clases, umbral=umbral)
+        ejemplos = [(caracteristicas(t), indice[e]) for t, e in zip(textos, etiquetas)]
+        rng = random.Random(semilla)
+        for epoca in range(epocas):
+            rng.shuffle(ejemplos)
+            paso = tasa / (1 + epoca)
+            for x, y in ejemplos:
+                p = _softmax(modelo._puntuaciones(x))
+                p[y] -= 1.0
+                for k, g in enumerate(p):
+                    modelo.sesgos[k] -= paso * g
+                for idx, valor in x.items():
+                    w = modelo.pesos.get(idx)
+                    if w is None:
+                        w = modelo.pesos[idx] = [0.0] * len(clases)
+                    for k, g in enumerate(p):
+                        w[k] -= paso * g * valor
+        return modelo
+
+    def guardar(self, directorio=MODELOS_DIR):
+        datos = {
+            "tarea": self.tarea,
+            "clases": self.clases,
+            "umbral": self.umbral,
+            "dimension": DIMENSION,
+            "metricas": self.metricas,
+            "sesgos": self.sesgos,
+            "pesos": {str(idx): [round(v, 6) for v in w] for idx, w in self.pesos.items()},
+        }
+        huella = hashlib.sha1(json.dumps(datos, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+        self.version = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{huella}"
+        datos["version"] = self.version
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        ruta = directorio / f"{self.tarea}-{self.version}.json"
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        return ruta
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos.get("dimension") != DIMENSION:
+            raise ValueError(f"Dimensión de hashing incompatible en {ruta}")
+        pesos = {int(idx): w for idx, w in datos["pesos"].items()}
+        return cls(datos["tarea"], datos["clases"], pesos, datos["sesgos"], datos["umbral"],
+                   datos["version"], datos.get("metricas"))
+
+
+def cargar_ultimo(tarea, directorio=MODELOS_DIR):
+    """
+    Carga la versión más reciente del modelo de la tarea, o None si no hay ninguno.
+    """
+    rutas = sorted(Path(directorio).glob(f"{tarea}-*.json"))
+    if not rutas:
+        return None
+    return ClasificadorLineal.cargar(rutas[-1])
+
+
+def informe(modelo, textos, etiquetas, umbrales=UMBRALES_INFORME):
+    """
+    Para cada umbral: fracción de textos que irían al zero-shot (fallback) y acuerdo
+    del modelo lineal con la etiqueta guardada en los textos que sí respondería.
+    """
+    predicciones = [modelo.predecir(t)[:2] for t in textos]
+    filas = []
+    for umbral in umbrales:
+        respondidas = [(p, e) for (p, c), e in zip(predicciones, etiquetas) if c >= umbral]
+        aciertos = sum(1 for p, e in respondidas if p == e)
+        filas.append({
+            "umbral": umbral,
+            "fallback": 1 - len(respondidas) / len(textos) if textos else 0.0,
+            "acuerdo": aciertos / len(respondidas) if respondidas else None,
+        })
+    global_ = sum(1 for (p, _), e in zip(predicciones, etiquetas) if p == e)
+    return {"acuerdo_total": global_ / len(textos) if textos else None, "umbrales": filas}
+
+
+def _imprimir_informe(datos):
+    print(f"Acuerdo total con las etiquetas guardadas: {datos['acuerdo_total']:.3f}")
+    print(f"{'umbral':>8} {'fallback':>9} {'acuerdo':>8}")
+    for fila in datos["umbrales"]:
+        acuerdo = f"{fila['acuerdo']:.3f}" if fila["acuerdo"] is not None else "-"
+        print(f"{fila['umbral']:>8.2f} {fila['fallback']:>9.3f} {acuerdo:>8}")
+
+
+def _leer_jsonl(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                yield json.loads(linea)
+
+
+def _leer_almacen(bucket, region, sqlite=None):
+    from almacenamiento import AlmacenS3, AlmacenSQLite
+    if sqlite:
+        return AlmacenSQLite(sqlite).iterar()
+    import boto3
+    return AlmacenS3(boto3.client("s3", region_name=region), bucket).iterar()
+
+
+def _dataset(incidencias, tarea):
+    # Las respuestas del modelo lineal o del fallback heurístico no se usan: el modelo
+    # aprendería de sus propios errores y el informe mediría el acuerdo consigo mismo
+    extraer_texto, campo, campo_origen = TAREAS[tarea]
+    textos, etiquetas = [], []
+    for inc in incidencias:
+        texto, etiqueta = extraer_texto(inc), inc.get(campo)
+        origen = inc.get(campo_origen, ORIGEN_ETIQUETAS)
+        if texto and etiqueta and etiqueta != "Desconocida" and origen == ORIGEN_ETIQUETAS:
+            textos.append(texto)
+            etiquetas.append(etiqueta)
+    return textos, etiquetas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento del clasificador en cascada")
+    parser.add_argument("accion", choices=["entrenar", "evaluar"])
+    parser.add_argument("--tarea", choices=sorted(TAREAS), required=True)
+    parser.add_argument("--jsonl", type=Path, help="Incidencias en JSON Lines (por defecto se leen de S3)")
+    parser.add_argument("--bucket", default="incidencias-ayuntamientos-dh")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--sqlite", help="Leer las incidencias de este fichero SQLite en lugar de S3")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_POR_DEFECTO)
+    parser.add_argument("--epocas", type=int, default=10)
+    parser.add_argument("--prueba", type=float, default=0.2, help="Fracción reservada para el informe")
+    parser.add_argument("--modelo", type=Path, help="Modelo a evaluar (por defecto el más reciente)")
+    parser.add_argument("--directorio", type=Path, default=MODELOS_DIR)
+    args = parser.parse_args(argv)
+
+    incidencias = _leer_jsonl(args.jsonl) if args.jsonl else _leer_almacen(args.bucket, args.region, args.sqlite)
+    textos, etiquetas = _dataset(incidencias, args.tarea)
+    if not textos:
+        print("No hay incidencias etiquetadas para esta tarea.")
+        return 1
+
+    if args.accion == "evaluar":
+        modelo = (ClasificadorLineal.cargar(args.modelo) if args.modelo
+                  else cargar_ultimo(args.tarea, args.directorio))
+        if modelo is None:
+            print(f"No hay ningún modelo para la tarea '{args.tarea}' en {args.directorio}")
+            return 1
+        print(f"Modelo {modelo.version} sobre {len(textos)} incidencias")
+        _imprimir_informe(informe(modelo, textos, etiquetas))
+        return 0
+
+    ejemplos = list(zip(textos, etiquetas))
+    random.Random(0).shuffle(ejemplos)
+    n_prueba = int(len(ejemplos) * args.prueba)
+    prueba, entrenamiento = ejemplos[:n_prueba], ejemplos[n_prueba:]
+    modelo = ClasificadorLineal.entrenar(args.tarea, [t for t, _ in entrenamiento],
+                                         [e for _, e in entrenamiento],
+                                         epocas=args.epocas, umbral=args.umbral)
+    if prueba:
+        datos = informe(modelo, [t for t, _ in prueba], [e for _, e in prueba])
+        print(f"Informe sobre {len(prueba)} incidencias reservadas:")
+        _imprimir_informe(datos)
+        modelo.metricas = {"n_entrenamiento": len(entrenamiento), "n_prueba": len(prueba), **datos}
+    ruta = modelo.guardar(args.directorio)
+    print(f"Modelo guardado en {ruta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
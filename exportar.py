@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Exportación masiva de incidencias a CSV o Parquet con memoria acotada.
+
+Las incidencias se leen del almacén página a página (en S3, sólo las particiones que pueden
+cumplir los filtros) y pasan por una cadena de generadores (incidencias → lotes), de modo
+que nunca hay más de un lote y una ventana de descargas en memoria:
+
+    python exportar.py --salida incidencias.csv
+    python exportar.py --formato parquet --salida farolas.parquet --categoria Farola --desde 2025-01-01
+    python exportar.py --sqlite incidencias.db --salida incidencias.csv
+    python exportar.py --benchmark 20000     # rendimiento contra un S3 local en memoria
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from metrics import con_contexto, span
+from particiones import es_clave_antigua
+from street_bundling import normalize_street
+
+# Columnas exportadas, en orden. Los campos que falten quedan vacíos.
+COLUMNAS = [
+    'ID', 'Ubicación', 'Municipio', 'Estado', 'Fecha de instalación', 'Última revisión', 'Tipo',
+    'Observaciones', 'Descripción adicional (EN)', 'Descripción adicional (ES)',
+    'Texto Extraído', 'Idioma detectado', 'Timestamp', 'Categoría', 'Probabilidades',
+    'Clasificador', 'Imagen', 'Miniatura',
+]
+FORMATOS = ("csv", "parquet")
+FILAS_POR_LOTE = 5000
+DESCARGAS_EN_VUELO = 32
+
+
+def _no_existe(error):
+    # ClientError de botocore con código NoSuchKey (o 404)
+    return getattr(error, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404")
+
+
+def _descargar(s3, bucket, clave):
+    try:
+        with span("s3.get_object"):
+            contenido = s3.get_object(Bucket=bucket, Key=clave)["Body"].read().decode("utf-8")
+    except Exception as e:
+        # `particiones.py migrar` puede haber movido la clave antigua después de listarla
+        if _no_existe(e) and es_clave_antigua(clave):
+            return None
+        raise
+    return json.loads(contenido) if contenido.strip() else None
+
+
+def iterar_incidencias(s3, bucket, claves, max_workers=8, en_vuelo=DESCARGAS_EN_VUELO, con_claves=False):
+    """
+    Descarga las incidencias en paralelo manteniendo como mucho `en_vuelo` peticiones
+    pendientes, y las devuelve en el orden de las claves (como pares (clave, incidencia)
+    si `con_claves`).
+    """
+    claves = iter(claves)
+    descargar = con_contexto(_descargar)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pendientes = deque((c, pool.submit(descargar, s3, bucket, c)) for c in islice(claves, en_vuelo))
+        while pendientes:
+            clave, futuro = pendientes.popleft()
+            inc = futuro.result()
+            siguiente = next(claves, None)
+            if siguiente is not None:
+                pendientes.append((siguiente, pool.submit(descargar, s3, bucket, siguiente)))
+            if inc is not None:
+                if not inc.get('Categoría'):
+                    inc['Categoría'] = 'Desconocida'
+                yield (clave, inc) if con_claves else inc
+
+
+def cumple(inc, categoria=None, desde=None, hasta=None, calle_norm=None):
+    """
+    True si la incidencia es de la categoría, está en el rango de fechas ('YYYY-MM-DD',
+    ambos incluidos, sobre el Timestamp) y en la calle ya normalizada.
+    """
+    if categoria and inc.get('Categoría') != categoria:
+        return False
+    fecha = inc.get('Timestamp', '')[:10]
+    if desde and fecha < desde:
+        return False
+    if hasta and fecha > hasta:
+        return False
+    if calle_norm:
+        loc = inc.get("Ubicación", inc.get("Ubicacion", ""))
+        if normalize_street(loc.split(",")[0]) != calle_norm:
+            return False
+    return True
+
+
+def a_fila(inc):
+    fila = {}
+    for col in COLUMNAS:
+        valor = inc.get(col)
+        if isinstance(valor, (dict, list)):
+            valor = json.dumps(valor, ensure_ascii=False)
+        fila[col] = "" if valor is None else str(valor)
+    return fila
+
+
+def por_lotes(incidencias, tamano=FILAS_POR_LOTE):
+    incidencias = iter(incidencias)
+    while True:
+        lote = [a_fila(inc) for inc in islice(incidencias, tamano)]
+        if not lote:
+            return
+        yield lote
+
+
+def escribir_csv(lotes, destino):
+    """
+    Escribe los lotes en un CSV; devuelve las filas escritas.
+    """
+    filas = 0
+    # utf-8-sig para que Excel abra bien las tildes
+    with open(destino, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNAS)
+        writer.writeheader()
+        for lote in lotes:
+            writer.writerows(lote)
+            filas += len(lote)
+    return filas
+
+
+def escribir_parquet(lotes, destino):
+    """
+    Escribe cada lote como un row group de Parquet; devuelve las filas escritas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([(col, pa.string()) for col in COLUMNAS])
+    filas = 0
+    with pq.ParquetWriter(destino, esquema, compression="snappy") as writer:
+        for lote in lotes:
+            tabla = pa.Table.from_pylist(lote, schema=esquema)
+            writer.write_table(tabla, row_group_size=len(lote))
+            filas += len(lote)
+    return filas
+
+
+def exportar(almacen, destino, formato="csv", categoria=None, desde=None, hasta=None,
+             calle=None, filas_por_lote=FILAS_POR_LOTE, progreso=None):
+    """
+    Exporta las incidencias filtradas del almacén (ver almacenamiento.py) a `destino`.
+    `progreso(leidas, exportadas)` se llama tras cada lote. Devuelve un resumen con
+    filas, incidencias leídas y segundos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    contador = {"leidas": 0, "exportadas": 0}
+
+    def contar_leidas(incidencias):
+        for inc in incidencias:
+            contador["leidas"] += 1
+            yield inc
+
+    def contar_lotes(lotes):
+        for lote in lotes:
+            contador["exportadas"] += len(lote)
+            yield lote
+            if progreso:
+                progreso(contador["leidas"], contador["exportadas"])
+
+    inicio = time.perf_counter()
+    filtros = {k: v for k, v in (("categoria", categoria), ("desde", desde), ("hasta", hasta), ("calle", calle)) if v}
+    incidencias = contar_leidas(almacen.iterar(filtros))
+    lotes = contar_lotes(por_lotes(incidencias, filas_por_lote))
+    escribir = escribir_csv if formato == "csv" else escribir_parquet
+    filas = escribir(lotes, destino)
+    return {"filas": filas, "leidas": contador["leidas"], "segundos": time.perf_counter() - inicio}
+
+
+def benchmark(n, formato="csv", latencia=0.0, filas_por_lote=FILAS_POR_LOTE):
+    """
+    Rellena un S3 local con n incidencias sintéticas y mide el rendimiento de la exportación.
+    """
+    import os
+    import resource
+    import tempfile
+    import uuid
+
+    from almacenamiento import AlmacenS3
+    from local_s3 import LocalS3Client
+    from synthetic_incidents import iterar_incidencias as sinteticas
+
+    almacen = AlmacenS3(LocalS3Client(latencia=latencia), "bench")
+    for inc in sinteticas(n):
+        almacen.put_incident(inc, str(uuid.uuid4()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        destino = os.path.join(tmp, f"export.{formato}")
+        resumen = exportar(almacen, destino, formato, filas_por_lote=filas_por_lote)
+        resumen["bytes"] = os.path.getsize(destino)
+    resumen["filas_por_segundo"] = resumen["filas"] / resumen["segundos"] if resumen["segundos"] else 0.0
+    resumen["rss_max_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportación de incidencias a CSV/Parquet")
+    parser.add_argument("--salida", help="Fichero de destino")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--categoria")
+    parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD")
+    parser.add_argument("--calle", help="Calle (se compara normalizada)")
+    parser.add_argument("--filas-por-lote", type=int, default=FILAS_POR_LOTE)
+    parser.add_argument("--bucket", default="incidencias-ayuntamientos-dh")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--sqlite", help="Leer de este fichero SQLite en lugar de S3")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="Medir el rendimiento con N incidencias sintéticas en un S3 local")
+    parser.add_argument("--latencia", type=float, default=0.0,
+                        help="Latencia simulada por petición en el benchmark (segundos)")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        r = benchmark(args.benchmark, args.formato, args.latencia, args.filas_por_lote)
+        print(f"{r['filas']} filas en {r['segundos']:.2f} s → {r['filas_por_segundo']:.0f} filas/s "
+              f"({r['bytes'] / 1e6:.1f} MB, RSS máx. {r['rss_max_mb']:.0f} MB)")
+        return 0
+
+    if not args.salida:
+        parser.error("--salida es obligatorio")
+
+    from almacenamiento import AlmacenS3, AlmacenSQLite
+    if args.sqlite:
+        almacen = AlmacenSQLite(args.sqlite)
+    else:
+        import boto3
+        almacen = AlmacenS3(boto3.client("s3", region_name=args.region), args.bucket)
+
+    def progreso(leidas, exportadas):
+        print(f"\r{leidas} leídas, {exportadas} exportadas", end="", file=sys.stderr, flush=True)
+
+    r = exportar(almacen, args.salida, args.formato, args.categoria, args.desde,
+                 args.hasta, args.calle, args.filas_por_lote, progreso)
+    print(f"\n{r['filas']} incidencias exportadas a {args.salida} en {r['segundos']:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Varios ayuntamientos en una misma instalación: cada municipio tiene su bucket y su
+región, los reportes nuevos se envían al municipio de su ubicación y la vista
+regional consulta todos los municipios a la vez.
+
+La configuración se lee del JSON indicado en URBANEYE_MUNICIPIOS:
+
+    {
+      "por_defecto": "valencia",
+      "municipios": [
+        {"id": "valencia", "nombre": "Valencia", "bucket": "incidencias-ayuntamientos-dh",
+         "region": "us-east-1", "alias": ["València"]},
+        {"id": "alboraya", "nombre": "Alboraya", "bucket": "incidencias-alboraya",
+         "region": "eu-west-1", "timeout": 8, "almacen": "sqlite", "sqlite": "alboraya.db"}
+      ]
+    }
+
+Sin configuración hay un único municipio con el bucket de siempre. `almacen` elige
+dónde se guardan las incidencias ("s3" o "sqlite", por defecto URBANEYE_ALMACEN o "s3");
+las fotos siempre van al bucket. Cada municipio con SQLite usa su propio fichero: el
+indicado en `sqlite` o `incidencias-<id>.db` en URBANEYE_SQLITE_DIR. URBANEYE_SQLITE
+sólo se admite cuando hay un único municipio.
+
+    python federacion.py resumen --categoria Farola --desde 2025-01-01
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from unidecode import unidecode
+
+from almacenamiento import AlmacenS3, AlmacenSQLite
+from metrics import con_contexto
+
+# Segundos que se espera a cada municipio en la vista regional si no indica otro
+TIMEOUT_MUNICIPIO = float(os.getenv("URBANEYE_TIMEOUT_MUNICIPIO", "5"))
+ALMACENES = ("s3", "sqlite")
+# Campos que se combinan en la vista regional
+CAMPOS_RESUMEN = ("Categoría", "Estado", "fecha")
+
+MUNICIPIOS_POR_DEFECTO = {
+    "por_defecto": "valencia",
+    "municipios": [
+        {"id": "valencia", "nombre": "Valencia", "bucket": "incidencias-ayuntamientos-dh",
+         "region": "us-east-1"},
+    ],
+}
+
+
+def _normalizar(texto):
+    return re.sub(r"\s+", " ", unidecode(texto or "").lower()).strip()
+
+
+class Municipio:
+    __slots__ = ("id", "nombre", "bucket", "region", "alias", "timeout", "almacen", "sqlite")
+
+    def __init__(self, id, nombre, bucket, region="us-east-1", alias=(), timeout=None,
+                 almacen=None, sqlite=None):
+        self.id = id
+        self.nombre = nombre
+        self.bucket = bucket
+        self.region = region
+        # Nombres con los que puede aparecer en la ubicación de un reporte
+        self.alias = {_normalizar(a) for a in (nombre, *alias)}
+        self.timeout = TIMEOUT_MUNICIPIO if timeout is None else float(timeout)
+        self.almacen = almacen or os.getenv("URBANEYE_ALMACEN", "s3")
+        if self.almacen not in ALMACENES:
+            raise ValueError(f"Almacén no soportado para {id}: {self.almacen}")
+        self.sqlite = sqlite
+
+
+class Federacion:
+    """
+    Municipios configurados, sus clientes de AWS (uno por región) y sus almacenes de
+    incidencias, creados al usarse.
+    """
+
+    def __init__(self, config):
+        self.municipios = {m["id"]: Municipio(**m) for m in config["municipios"]}
+        if not self.municipios:
+            raise ValueError("La configuración no tiene municipios")
+        defecto = config.get("por_defecto") or next(iter(self.municipios))
+        if defecto not in self.municipios:
+            raise ValueError(f"Municipio por defecto desconocido: {defecto}")
+        self.por_defecto = self.municipios[defecto]
+        self._asignar_ficheros_sqlite()
+        self._clientes = {}
+        self._almacenes = {}
+        self._lock = threading.Lock()
+
+    def _asignar_ficheros_sqlite(self):
+        # Un fichero por municipio: AlmacenSQLite no separa las incidencias de varios municipios
+        global_ = os.getenv("URBANEYE_SQLITE")
+        if global_ and len(self.municipios) > 1:
+            raise ValueError("URBANEYE_SQLITE sólo se admite con un único municipio; "
+                             "usa URBANEYE_SQLITE_DIR o 'sqlite' en cada municipio")
+        directorio = os.getenv("URBANEYE_SQLITE_DIR", ".")
+        rutas = {}
+        for m in self.municipios.values():
+            if not m.sqlite:
+                m.sqlite = global_ or os.path.join(directorio, f"incidencias-{m.id}.db")
+            ruta = os.path.abspath(m.sqlite)
+            if m.almacen == "sqlite" and ruta in rutas:
+                raise ValueError(f"{rutas[ruta]} y {m.id} comparten el fichero SQLite {m.sqlite}")
+            if m.almacen == "sqlite":
+                rutas[ruta] = m.id
+
+    @classmethod
+    def desde_entorno(cls):
+        ruta = os.getenv("URBANEYE_MUNICIPIOS")
+        if not ruta:
+            return cls(MUNICIPIOS_POR_DEFECTO)
+        with open(ruta, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.municipios)
+
+    def municipio(self, municipio_id=None):
+        return self.municipios.get(municipio_id, self.por_defecto)
+
+    def _cliente(self, servicio, region):
+        with self._lock:
+            cliente = self._clientes.get((servicio, region))
+            if cliente is None:
+                import boto3
+                cliente = self._clientes[(servicio, region)] = boto3.client(servicio, region_name=region)
+            return cliente
+
+    def s3(self, municipio):
+        return self._cliente("s3", municipio.region)
+
+    def rekognition(self, municipio):
+        return self._cliente("rekognition", municipio.region)
+
+    def almacen(self, municipio):
+        almacen = self._almacenes.get(municipio.id)
+        if almacen is None:
+            if municipio.almacen == "sqlite":
+                almacen = AlmacenSQLite(municipio.sqlite)
+            else:
+                almacen = AlmacenS3(self.s3(municipio), municipio.bucket)
+            with self._lock:
+                almacen = self._almacenes.setdefault(municipio.id, almacen)
+        return almacen
+
+    def resolver(self, ubicacion):
+        """
+        Municipio de una ubicación como 'Calle Mayor, 5, Alboraya'. La primera parte es la
+        calle y no se mira ('Calle de Alboraya' está en Valencia); el resto se compara
+        entero con los alias, empezando por el final (donde suele ir la ciudad). Si no
+        coincide ninguno, el de por defecto.
+        """
+        partes = [_normalizar(p) for p in (ubicacion or "").split(",")[1:]]
+        for parte in reversed(partes):
+            for municipio in self.municipios.values():
+                if parte in municipio.alias:
+                    return municipio
+        return self.por_defecto
+
+    def consultar_todos(self, funcion, municipios=None, max_workers=None):
+        """
+        Ejecuta funcion(municipio, almacen, cancelado) en todos los municipios a la vez.
+        Cada municipio tiene su propio timeout, contado desde el inicio, así que la
+        consulta dura lo que el más lento (o su timeout), no la suma.
+
+        Devuelve {id: {"estado": "ok" | "timeout" | "error", "segundos", "resultado" | "error"}}.
+        A los que agotan el timeout se les activa `cancelado` para que dejen de trabajar.
+        """
+        municipios = list(municipios or self.municipios.values())
+        cancelado = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=max_workers or len(municipios),
+                                  thread_name_prefix="municipio")
+        inicio = time.perf_counter()
+
+        def cronometrar(municipio):
+            resultado = funcion(municipio, self.almacen(municipio), cancelado)
+            return resultado, time.perf_counter() - inicio
+
+        # Cada municipio registra sus spans con el ID de correlación de la consulta
+        futuros = {m.id: pool.submit(con_contexto(cronometrar), m) for m in municipios}
+        resultados = {}
+        try:
+            for m in sorted(municipios, key=lambda m: m.timeout):
+                restante = max(0.0, inicio + m.timeout - time.perf_counter())
+                try:
+                    resultado, segundos = futuros[m.id].result(timeout=restante)
+                    resultados[m.id] = {"estado": "ok", "resultado": resultado, "segundos": segundos}
+                except FuturesTimeoutError:
+                    resultados[m.id] = {"estado": "timeout", "segundos": time.perf_counter() - inicio}
+                except Exception as e:
+                    resultados[m.id] = {"estado": "error", "error": str(e), "segundos": time.perf_counter() - inicio}
+        finally:
+            if any(r["estado"] == "timeout" for r in resultados.values()):
+                cancelado.set()
+            # No se espera a los municipios que han agotado el timeout
+            pool.shutdown(wait=False, cancel_futures=True)
+        return {m.id: resultados[m.id] for m in municipios}
+
+
+def combinar(resumenes):
+    """
+    Suma los conteos de aggregate() de varios municipios.
+    """
+    combinado = {campo: Counter() for campo in CAMPOS_RESUMEN}
+    for r in resumenes:
+        for campo in CAMPOS_RESUMEN:
+            combinado[campo].update(r[campo])
+    return combinado
+
+
+def vista_regional(federacion, categoria=None, desde=None, hasta=None):
+    """
+    Conteos de cada municipio y el combinado de los que respondieron a tiempo.
+    `completo` es False si falta alguno.
+    """
+    filtros = {k: v for k, v in (("categoria", categoria), ("desde", desde), ("hasta", hasta)) if v}
+
+    def consultar(municipio, almacen, cancelado):
+        return almacen.aggregate(CAMPOS_RESUMEN, filtros, cancelado)
+
+    por_municipio = federacion.consultar_todos(consultar)
+    respondidos = [r["resultado"] for r in por_municipio.values() if r["estado"] == "ok"]
+    return {
+        "municipios": por_municipio,
+        "combinado": combinar(respondidos),
+        "completo": len(respondidos) == len(por_municipio),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vista regional de todos los municipios")
+    parser.add_argument("accion", choices=["resumen"])
+    parser.add_argument("--categoria")
+    parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD")
+    args = parser.parse_args(argv)
+
+    federacion = Federacion.desde_entorno()
+    vista = vista_regional(federacion, args.categoria, args.desde, args.hasta)
+    for municipio_id, r in vista["municipios"].items():
+        detalle = sum(r["resultado"]["Categoría"].values()) if r["estado"] == "ok" else r.get("error", "")
+        print(f"{federacion.municipio(municipio_id).nombre:<20} {r['estado']:<8} {r['segundos']:6.2f} s  {detalle}")
+    por_categoria = vista["combinado"]["Categoría"]
+    print(f"\nTotal: {sum(por_categoria.values())} incidencias{'' if vista['completo'] else ' (resultados parciales)'}")
+    for categoria, n in por_categoria.most_common():
+        print(f"  {categoria:<15} {n}")
+    return 0 if vista["completo"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
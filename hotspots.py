@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Detector de picos de incidencias (hotspots) por calle normalizada y por ID de activo.
+
+Cada clave tiene un anillo de contadores por intervalos de tiempo: registrar una
+incidencia es O(1) y los intervalos antiguos se reutilizan al dar la vuelta al anillo,
+así que la memoria por clave es fija. Una clave es hotspot cuando en la ventana
+reciente tiene al menos `umbral_reportes` incidencias o cuando su z-score respecto al
+histórico del anillo supera `umbral_z`.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from street_bundling import normalize_street
+
+
+class ContadorVentana:
+    """
+    Anillo de `n_intervalos` contadores de `segundos` cada uno. Mantiene sumas
+    acumuladas de la ventana reciente (los últimos `intervalos_ventana`) y del
+    histórico (suma y suma de cuadrados), que se ajustan al reciclar intervalos, así
+    que registrar y evaluar no recorren el anillo.
+    """
+
+    __slots__ = ("segundos", "ventana", "conteos", "epocas", "actual", "ultimo",
+                 "suma_ventana", "suma_historico", "suma2_historico")
+
+    def __init__(self, segundos, n_intervalos, intervalos_ventana):
+        self.segundos = segundos
+        self.ventana = intervalos_ventana
+        self.conteos = [0] * n_intervalos
+        self.epocas = [-1] * n_intervalos
+        self.actual = None
+        self.ultimo = 0.0
+        self.suma_ventana = 0
+        self.suma_historico = 0
+        self.suma2_historico = 0
+
+    def _conteo(self, epoca):
+        i = epoca % len(self.conteos)
+        return self.conteos[i] if self.epocas[i] == epoca else 0
+
+    def avanzar(self, ahora):
+        """
+        Mueve el intervalo actual hasta `ahora`: los que salen de la ventana pasan al
+        histórico y los que salen del anillo se restan. Cada intervalo se mueve una
+        sola vez, así que el coste es O(1) amortizado.
+        """
+        epoca = int(ahora // self.segundos)
+        if self.actual is None or epoca - self.actual >= len(self.conteos):
+            # Primera incidencia o una vuelta entera sin actividad: todo ha caducado
+            self.suma_ventana = self.suma_historico = self.suma2_historico = 0
+            self.actual = epoca
+            return
+        n = len(self.conteos)
+        while self.actual < epoca:
+            self.actual += 1
+            c = self._conteo(self.actual - self.ventana)
+            self.suma_ventana -= c
+            self.suma_historico += c
+            self.suma2_historico += c * c
+            c = self._conteo(self.actual - n)
+            self.suma_historico -= c
+            self.suma2_historico -= c * c
+
+    def registrar(self, ts):
+        self.avanzar(ts)
+        epoca = int(ts // self.segundos)
+        if epoca <= self.actual - len(self.conteos):
+            return  # Más antigua que todo el anillo
+        i = epoca % len(self.conteos)
+        if self.epocas[i] != epoca:
+            # El intervalo del anillo pertenecía a una vuelta anterior (ya descontada): se recicla
+            self.epocas[i] = epoca
+            self.conteos[i] = 0
+        c = self.conteos[i]
+        self.conteos[i] = c + 1
+        if epoca > self.actual - self.ventana:
+            self.suma_ventana += 1
+        else:
+            self.suma_historico += 1
+            self.suma2_historico += 2 * c + 1
+        self.ultimo = max(self.ultimo, ts)
+
+    def serie(self, ahora):
+        """
+        Conteos de los intervalos del anillo, del más antiguo al actual (0 si caducado).
+        Recorre el anillo; sólo para depurar y comprobar las sumas.
+        """
+        actual = int(ahora // self.segundos)
+        n = len(self.conteos)
+        return [self._conteo(epoca) for epoca in range(actual - n + 1, actual + 1)]
+
+
+class HotspotDetector:
+    def __init__(self, segundos_intervalo=900, intervalos_ventana=4, intervalos_historico=96,
+                 umbral_reportes=3, umbral_z=3.0, min_reportes=2, max_claves=50000):
+        self.segundos_intervalo = segundos_intervalo
+        self.intervalos_ventana = intervalos_ventana
+        self.n_intervalos = intervalos_ventana + intervalos_historico
+        self.umbral_reportes = umbral_reportes
+        self.umbral_z = umbral_z
+        self.min_reportes = min_reportes
+        self.max_claves = max_claves
+        self._contadores = OrderedDict()
+        self._activos = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_entorno(cls):
+        return cls(
+            segundos_intervalo=int(os.getenv("URBANEYE_HOTSPOT_INTERVALO_S", "900")),
+            intervalos_ventana=int(os.getenv("URBANEYE_HOTSPOT_VENTANA", "4")),
+            intervalos_historico=int(os.getenv("URBANEYE_HOTSPOT_HISTORICO", "96")),
+            umbral_reportes=int(os.getenv("URBANEYE_HOTSPOT_UMBRAL_REPORTES", "3")),
+            umbral_z=float(os.getenv("URBANEYE_HOTSPOT_UMBRAL_Z", "3.0")),
+        )
+
+    @staticmethod
+    def claves(inc):
+        """
+        Claves que actualiza una incidencia: su calle normalizada y el ID del activo.
+        """
+        claves = []
+        loc = inc.get("Ubicación", inc.get("Ubicacion", ""))
+        calle = normalize_street(loc.split(",")[0]) if loc else ""
+        if calle:
+            claves.append(("calle", calle))
+        asset_id = inc.get("ID")
+        if asset_id and asset_id != "No disponible":
+            claves.append(("activo", asset_id))
+        return claves
+
+    def _evaluar(self, contador, ahora):
+        # O(1): las sumas del contador ya están al día (salvo los intervalos que avanzar() mueva)
+        contador.avanzar(ahora)
+        reciente = contador.suma_ventana
+        h = self.n_intervalos - self.intervalos_ventana
+        media = contador.suma_historico / h if h else 0.0
+        varianza = max(0.0, contador.suma2_historico / h - media * media) if h else 0.0
+        # z-score de la suma de la ventana frente a la de intervalos independientes del histórico
+        w = self.intervalos_ventana
+        z = (reciente - w * media) / math.sqrt(w * varianza + 1.0)
+        es_hotspot = reciente >= self.umbral_reportes or (reciente >= self.min_reportes and z >= self.umbral_z)
+        return es_hotspot, reciente, z
+
+    def registrar(self, inc, ts=None):
+        """
+        Actualiza los contadores con la incidencia y devuelve los hotspots que se
+        acaban de activar (los que ya estaban activos no se repiten).
+        """
+        if ts is None:
+            try:
+                # Los Timestamp se guardan en UTC sin zona (utcnow): no deben leerse como hora local
+                fecha = datetime.fromisoformat(inc["Timestamp"])
+                if fecha.tzinfo is None:
+                    fecha = fecha.replace(tzinfo=timezone.utc)
+                ts = fecha.timestamp()
+            except (KeyError, TypeError, ValueError):
+                ts = time.time()
+        eventos = []
+        with self._lock:
+            for clave in self.claves(inc):
+                contador = self._contadores.get(clave)
+                if contador is None:
+                    contador = self._contadores[clave] = ContadorVentana(
+                        self.segundos_intervalo, self.n_intervalos, self.intervalos_ventana)
+                    if len(self._contadores) > self.max_claves:
+                        viejo, _ = self._contadores.popitem(last=False)
+                        self._activos.pop(viejo, None)
+                else:
+                    self._contadores.move_to_end(clave)
+                contador.registrar(ts)
+                es_hotspot, reciente, z = self._evaluar(contador, ts)
+                if es_hotspot and clave not in self._activos:
+                    evento = {"tipo": clave[0], "clave": clave[1], "reportes": reciente,
+                              "z": round(z, 2), "desde": datetime.fromtimestamp(ts, timezone.utc).isoformat()}
+                    self._activos[clave] = evento
+                    eventos.append(evento)
+            self._purgar(ts)
+        return eventos
+
+    def _purgar(self, ahora):
+        # Las claves sin actividad en todo el anillo no aportan nada: se eliminan.
+        # Se recorren desde las menos recientes y se para en la primera con actividad.
+        limite = ahora - self.segundos_intervalo * self.n_intervalos
+        while self._contadores:
+            clave, contador = next(iter(self._contadores.items()))
+            if contador.ultimo >= limite:
+                break
+            del self._contadores[clave]
+            self._activos.pop(clave, None)
+
+    def hotspots_activos(self, ahora=None):
+        """
+        Hotspots vigentes, del más intenso al menos. Sólo se revisan las claves activas.
+        """
+        ahora = time.time() if ahora is None else ahora
+        vigentes = []
+        with self._lock:
+            for clave, evento in list(self._activos.items()):
+                contador = self._contadores.get(clave)
+                es_hotspot, reciente, z = self._evaluar(contador, ahora) if contador else (False, 0, 0.0)
+                if not es_hotspot:
+                    del self._activos[clave]
+                    continue
+                evento.update(reportes=reciente, z=round(z, 2))
+                vigentes.append(dict(evento))
+        return sorted(vigentes, key=lambda e: (e["reportes"], e["z"]), reverse=True)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import re
+
+# Patrones de los campos impresos en la etiqueta identificativa del mobiliario.
+# Se compilan una sola vez a nivel de módulo.
+_PATRONES_ETIQUETA = {
+    'ID': re.compile(r'ID:\s*([A-Z0-9-]+)'),
+    'Estado': re.compile(r'Estado:\s*(\w+)'),
+    'Fecha de instalación': re.compile(r'Fecha de instalación:\s*(\d{4}-\d{2}-\d{2})'),
+    'Última revisión': re.compile(r'Última revisión:\s*(\d{4}-\d{2}-\d{2})'),
+    'Tipo': re.compile(r'Tipo:\s*(.+)'),
+    'Observaciones': re.compile(r'Observaciones:\s*(.+)'),
+}
+
+
+def extraer_campos_etiqueta(texto: str) -> dict:
+    """
+    Extrae los campos de la etiqueta a partir del texto detectado por OCR.
+    Los campos que no aparecen se devuelven como None:
+    'ID: F-001 Estado: Activo' → {'ID': 'F-001', 'Estado': 'Activo', 'Tipo': None, ...}
+    """
+    campos = {}
+    for campo, patron in _PATRONES_ETIQUETA.items():
+        match = patron.search(texto)
+        campos[campo] = match.group(1) if match else None
+    return campos
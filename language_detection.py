@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+from collections import Counter
+
+# Textos de referencia para construir los perfiles de n-gramas de cada idioma.
+# Incluyen vocabulario del dominio (mobiliario urbano) para que las descripciones
+# cortas se clasifiquen bien.
+_CORPUS = {
+    "es": """
+    la farola está apagada desde hace varios días y la calle está muy oscura por la noche
+    el banco del parque está roto y tiene grafitis, faltan tablas en el asiento
+    la papelera está llena y la basura se desborda sobre la acera
+    el contenedor de reciclaje está quemado y huele muy mal, hay que cambiarlo
+    la señal de tráfico está doblada y no se ve bien desde la carretera
+    han robado la tapa del contenedor y los vecinos dejan las bolsas en el suelo
+    la luz parpadea toda la noche, creo que la bombilla está fundida
+    hay un poste de luz inclinado tras el golpe de un coche en la esquina
+    el semáforo no funciona y es peligroso cruzar con los niños
+    alguien ha arrancado la papelera del poste y está tirada en medio de la plaza
+    el asiento está rayado y la pintura se ha caído por el sol
+    por favor, envíen a alguien para arreglar el desperfecto lo antes posible
+    los vecinos del barrio llevamos una semana quejándonos de este problema
+    que no funciona, que está roto, que es un peligro para la gente mayor
+    junto al colegio, en la avenida, cerca de la parada del autobús
+    """,
+    "en": """
+    the streetlight has been off for several days and the street is very dark at night
+    the bench in the park is broken and covered in graffiti, some boards are missing
+    the trash can is full and the rubbish is overflowing onto the pavement
+    the recycling container is burnt and smells really bad, it should be replaced
+    the traffic sign is bent and it cannot be seen properly from the road
+    someone stole the lid of the bin and neighbours leave their bags on the ground
+    the light keeps flickering all night, I think the bulb is blown
+    there is a lamp post leaning after a car hit it on the corner
+    the traffic light is not working and it is dangerous to cross with the kids
+    somebody ripped the litter bin off the post and it is lying in the middle of the square
+    the seat is scratched and the paint has peeled off because of the sun
+    please send someone to fix the damage as soon as possible
+    people in the neighbourhood have been complaining about this issue for a week
+    it does not work, it is broken, it is a hazard for elderly people
+    next to the school, on the avenue, near the bus stop
+    """,
+}
+
+_ORDENES = (1, 2, 3)
+_NO_LETRAS = re.compile(r"[^\w\s]|\d|_")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def _ngramas(texto):
+    texto = _ESPACIOS.sub(" ", _NO_LETRAS.sub(" ", texto.lower())).strip()
+    texto = f" {texto} "
+    for n in _ORDENES:
+        for i in range(len(texto) - n + 1):
+            gram = texto[i:i + n]
+            if gram != " " * n:
+                yield gram
+
+
+def _construir_perfiles(corpus):
+    perfiles = {}
+    vocabulario = set()
+    conteos = {idioma: Counter(_ngramas(texto)) for idioma, texto in corpus.items()}
+    for c in conteos.values():
+        vocabulario.update(c)
+    v = len(vocabulario)
+    for idioma, c in conteos.items():
+        total = sum(c.values())
+        # Suavizado de Laplace: log P(gram | idioma)
+        perfiles[idioma] = (
+            {gram: math.log((n + 1) / (total + v)) for gram, n in c.items()},
+            math.log(1 / (total + v)),
+        )
+    return perfiles
+
+
+_PERFILES = _construir_perfiles(_CORPUS)
+
+
+def puntuar_idiomas(texto: str) -> dict:
+    """
+    Log-verosimilitud del texto para cada idioma según su perfil de n-gramas.
+    """
+    grams = Counter(_ngramas(texto))
+    puntuaciones = {}
+    for idioma, (logp, logp_desconocido) in _PERFILES.items():
+        puntuaciones[idioma] = sum(n * logp.get(g, logp_desconocido) for g, n in grams.items())
+    return puntuaciones
+
+
+def detectar_idioma(texto: str, por_defecto: str = "es") -> str:
+    """
+    Detecta si una descripción está en español o en inglés:
+    'la farola está apagada' → 'es', 'the bench is broken' → 'en'
+    Si el texto no tiene letras se devuelve el idioma por defecto.
+    """
+    if not texto or not any(ch.isalpha() for ch in texto):
+        return por_defecto
+    puntuaciones = puntuar_idiomas(texto)
+    return max(puntuaciones, key=puntuaciones.get)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga de extremo a extremo: simula ciudadanos que reportan incidencias y
+técnicos que consultan el listado y las estadísticas, con concurrencia creciente.
+
+Importa app.py sin servidor (modo "bare" de Streamlit) y ejecuta los flujos reales
+(procesar_incidencia, ver_incidencias, pagina_estadisticas) con S3 y Rekognition
+sustituidos por local_s3. Por defecto los modelos también se sustituyen por unos
+falsos que consumen un tiempo de CPU configurable; con --modelos-reales se cargan
+los modelos de Hugging Face.
+
+    python loadtest.py
+    python loadtest.py --concurrencia 1 4 16 --duracion 20 --mezcla reporte=6 listado=3 estadisticas=1
+    python loadtest.py --almacen sqlite             # incidencias en SQLite en lugar de S3
+    python loadtest.py --guardar-base               # guarda la ejecución como referencia
+    python loadtest.py --comparar-base              # falla si empeora respecto a la referencia
+"""
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from local_s3 import LocalS3Client, LocalRekognitionClient
+from synthetic_incidents import iterar_incidencias
+
+DIRECTORIO_RESULTADOS = Path("bench_results")
+BASE_POR_DEFECTO = DIRECTORIO_RESULTADOS / "loadtest_base.json"
+# Regresión: p95 un 20 % peor o throughput un 20 % menor que la referencia
+TOLERANCIA = 0.20
+FLUJOS = ("reporte", "listado", "estadisticas")
+
+
+def _ocupar_cpu(segundos):
+    # Simula un modelo en CPU: mantiene el GIL ocupado como lo haría la inferencia
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        pass
+
+
+class _TraductorFalso:
+    """Hace de MarianTokenizer y de MarianMTModel: devuelve el mismo texto."""
+
+    def __init__(self, coste):
+        self.coste = coste
+        self.name_or_path = "traductor-falso"
+
+    def to(self, device):
+        return self
+
+    def __call__(self, textos, **kwargs):
+        return {"texto": textos[0]}
+
+    def generate(self, texto, **kwargs):
+        _ocupar_cpu(self.coste)
+        return [texto]
+
+    def decode(self, ids, **kwargs):
+        return ids
+
+
+class _ZeroShotFalso:
+    def __init__(self, coste):
+        self.coste = coste
+
+    def __call__(self, texto, candidate_labels):
+        _ocupar_cpu(self.coste)
+        etiquetas = list(candidate_labels)
+        random.shuffle(etiquetas)
+        return {"labels": etiquetas, "scores": [0.5] + [0.1] * (len(etiquetas) - 1)}
+
+
+def _imagen_png():
+    from PIL import Image
+    salida = io.BytesIO()
+    Image.new("RGB", (1024, 768), (180, 180, 180)).save(salida, "PNG")
+    return salida.getvalue()
+
+
+class ErrorDePagina(RuntimeError):
+    """Error que una página habría mostrado al usuario con st.error."""
+
+
+def preparar_app(pila, args):
+    """
+    Importa app.py con los servicios sustituidos y un almacén precargado.
+    """
+    s3 = LocalS3Client(latencia=args.latencia_s3)
+    rekognition = LocalRekognitionClient(
+        texto="ID: B-0042 Estado: Activo Fecha de instalación: 2019-05-01 Tipo: Banco de madera",
+        latencia=args.latencia_rekognition,
+    )
+    entorno = {"URBANEYE_ALMACEN": args.almacen}
+    if args.almacen == "sqlite":
+        entorno["URBANEYE_SQLITE"] = os.path.join(pila.enter_context(tempfile.TemporaryDirectory()), "incidencias.db")
+    pila.enter_context(mock.patch.dict(os.environ, entorno))
+
+    pila.enter_context(mock.patch("boto3.client",
+                                  side_effect=lambda servicio, **kw: s3 if servicio == "s3" else rekognition))
+    if not args.modelos_reales:
+        import transformers
+        traductor = _TraductorFalso(args.coste_traduccion)
+        pila.enter_context(mock.patch.object(transformers, "pipeline",
+                                             return_value=_ZeroShotFalso(args.coste_zero_shot)))
+        for clase in ("MarianTokenizer", "MarianMTModel"):
+            sustituto = mock.Mock()
+            sustituto.from_pretrained.return_value = traductor
+            pila.enter_context(mock.patch.object(transformers, clase, sustituto))
+
+    app = importlib.import_module("app")
+    # Las páginas capturan sus excepciones y las muestran con st.error: sin esto un
+    # listado o unas estadísticas rotas contarían como operaciones rápidas y correctas
+    pila.enter_context(mock.patch.object(app.st, "error", side_effect=ErrorDePagina))
+    # En modo "bare" Streamlit avisa en cada llamada de que no hay sesión: se silencia
+    for nombre in list(logging.root.manager.loggerDict):
+        if nombre.startswith("streamlit"):
+            logging.getLogger(nombre).setLevel(logging.ERROR)
+    logging.getLogger("urbaneye").setLevel(logging.WARNING)
+
+    almacen = app.federacion.almacen(app.federacion.por_defecto)
+    for inc in iterar_incidencias(args.incidencias_iniciales):
+        almacen.put_incident(inc)
+    return app, s3
+
+
+def _flujos(app):
+    imagen = _imagen_png()
+    rng = random.Random(1)
+    generador = iterar_incidencias(10 ** 9, semilla=7)
+    lock = threading.Lock()
+
+    def reporte():
+        with lock:
+            inc = next(generador)
+            descripcion = inc["Descripción adicional (ES)"] if rng.random() < 0.6 else inc["Descripción adicional (EN)"]
+        if app.procesar_incidencia(io.BytesIO(imagen), inc["Ubicación"], descripcion) is None:
+            raise RuntimeError("procesar_incidencia no guardó la incidencia")
+
+    return {
+        "reporte": reporte,
+        "listado": app.ver_incidencias,
+        "estadisticas": app.pagina_estadisticas,
+    }
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[k]
+
+
+def ejecutar_nivel(flujos, mezcla, concurrencia, duracion, semilla=0):
+    """
+    Ejecuta la mezcla de flujos con `concurrencia` usuarios simultáneos durante
+    `duracion` segundos. Devuelve latencias y errores por flujo.
+    """
+    nombres = [n for n in FLUJOS if mezcla.get(n)]
+    pesos = [mezcla[n] for n in nombres]
+    latencias = {n: [] for n in nombres}
+    errores = {n: 0 for n in nombres}
+    lock = threading.Lock()
+    fin = time.perf_counter() + duracion
+
+    def usuario(i):
+        rng = random.Random(semilla * 1000 + i)
+        while time.perf_counter() < fin:
+            flujo = rng.choices(nombres, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                flujos[flujo]()
+                ok = True
+            except Exception:
+                ok = False
+            transcurrido = time.perf_counter() - inicio
+            with lock:
+                if ok:
+                    latencias[flujo].append(transcurrido)
+                else:
+                    errores[flujo] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(usuario, range(concurrencia)))
+    total = time.perf_counter() - inicio
+
+    resultado = {"concurrencia": concurrencia, "segundos": total, "flujos": {}}
+    for n in nombres:
+        lat = latencias[n]
+        resultado["flujos"][n] = {
+            "operaciones": len(lat),
+            "errores": errores[n],
+            "throughput": len(lat) / total,
+            "p50": _percentil(lat, 50),
+            "p95": _percentil(lat, 95),
+            "p99": _percentil(lat, 99),
+        }
+    resultado["rss_max_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return resultado
+
+
+def _ms(v):
+    return f"{v * 1000:8.0f}" if v is not None else "       -"
+
+
+def imprimir(resultado):
+    print(f"\nConcurrencia {resultado['concurrencia']} ({resultado['segundos']:.1f} s, "
+          f"RSS máx. {resultado['rss_max_mb']:.0f} MB)")
+    print(f"  {'flujo':<13} {'ops':>6} {'err':>4} {'ops/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for n, r in resultado["flujos"].items():
+        print(f"  {n:<13} {r['operaciones']:>6} {r['errores']:>4} {r['throughput']:>7.2f} "
+              f"{_ms(r['p50'])} {_ms(r['p95'])} {_ms(r['p99'])}")
+
+
+def comparar_con_base(niveles, base, tolerancia=TOLERANCIA):
+    """
+    Devuelve las regresiones (p95 o throughput) respecto a la ejecución de referencia.
+    """
+    previos = {(n["concurrencia"], f): r for n in base["niveles"] for f, r in n["flujos"].items()}
+    regresiones = []
+    for nivel in niveles:
+        for flujo, r in nivel["flujos"].items():
+            previo = previos.get((nivel["concurrencia"], flujo))
+            if not previo or not previo["operaciones"] or not r["operaciones"]:
+                continue
+            if previo["p95"] and r["p95"] > previo["p95"] * (1 + tolerancia):
+                regresiones.append(f"c={nivel['concurrencia']} {flujo}: p95 {_ms(previo['p95']).strip()} → {_ms(r['p95']).strip()} ms")
+            if r["throughput"] < previo["throughput"] * (1 - tolerancia):
+                regresiones.append(f"c={nivel['concurrencia']} {flujo}: {previo['throughput']:.2f} → {r['throughput']:.2f} ops/s")
+    return regresiones
+
+
+def _mezcla(valores):
+    mezcla = {}
+    for valor in valores:
+        flujo, _, peso = valor.partition("=")
+        if flujo not in FLUJOS:
+            raise argparse.ArgumentTypeError(f"Flujo desconocido: {flujo}")
+        mezcla[flujo] = float(peso or 1)
+    return mezcla
+
+
+def _commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "desconocido"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de UrbanEye")
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por nivel de concurrencia")
+    parser.add_argument("--mezcla", nargs="+", default=["reporte=6", "listado=3", "estadisticas=1"],
+                        help="Pesos de cada flujo, p. ej. reporte=6 listado=3 estadisticas=1")
+    parser.add_argument("--incidencias-iniciales", type=int, default=500)
+    parser.add_argument("--latencia-s3", type=float, default=0.01)
+    parser.add_argument("--latencia-rekognition", type=float, default=0.3)
+    parser.add_argument("--coste-traduccion", type=float, default=0.15,
+                        help="Segundos de CPU de cada generate falso")
+    parser.add_argument("--coste-zero-shot", type=float, default=0.25,
+                        help="Segundos de CPU de cada llamada zero-shot falsa")
+    parser.add_argument("--almacen", choices=["s3", "sqlite"], default="s3",
+                        help="Almacén de incidencias (sqlite usa un fichero temporal)")
+    parser.add_argument("--modelos-reales", action="store_true", help="Usar los modelos de Hugging Face en CPU")
+    parser.add_argument("--salida", type=Path, help="JSON de resultados (por defecto bench_results/loadtest-<commit>.json)")
+    parser.add_argument("--base", type=Path, default=BASE_POR_DEFECTO, help="JSON de referencia")
+    parser.add_argument("--guardar-base", action="store_true", help="Guardar esta ejecución como referencia")
+    parser.add_argument("--comparar-base", action="store_true", help="Comparar con la referencia y fallar si empeora")
+    args = parser.parse_args(argv)
+    mezcla = _mezcla(args.mezcla)
+
+    with ExitStack() as pila:
+        app, _ = preparar_app(pila, args)
+        flujos = _flujos(app)
+        niveles = []
+        for concurrencia in args.concurrencia:
+            nivel = ejecutar_nivel(flujos, mezcla, concurrencia, args.duracion)
+            imprimir(nivel)
+            niveles.append(nivel)
+
+    commit = _commit_actual()
+    datos = {
+        "commit": commit,
+        "fecha": datetime.utcnow().isoformat(),
+        "parametros": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "niveles": niveles,
+    }
+    salida = args.salida or DIRECTORIO_RESULTADOS / f"loadtest-{commit}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.guardar_base:
+        args.base.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        print(f"Referencia guardada en {args.base}")
+
+    if args.comparar_base:
+        with open(args.base, encoding="utf-8") as f:
+            regresiones = comparar_con_base(niveles, json.load(f))
+        if regresiones:
+            print("\nRegresiones respecto a la referencia:")
+            for r in regresiones:
+                print(f"  {r}")
+            return 1
+        print("\nSin regresiones respecto a la referencia.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
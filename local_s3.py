@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Sustituto local y en memoria del cliente S3 de boto3, para benchmarks y pruebas de
+carga sin AWS. Implementa sólo las llamadas que usa UrbanEye.
+"""
+import io
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import islice
+
+from botocore.exceptions import ClientError
+
+
+class _Body:
+    def __init__(self, datos):
+        self._stream = io.BytesIO(datos)
+
+    def read(self, n=-1):
+        return self._stream.read(n)
+
+
+class _Paginador:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            params = dict(kwargs)
+            if token:
+                params["ContinuationToken"] = token
+            pagina = self._cliente.list_objects_v2(**params)
+            yield pagina
+            if not pagina.get("IsTruncated"):
+                return
+            token = pagina["NextContinuationToken"]
+
+
+class LocalS3Client:
+    """
+    Cliente S3 en memoria. `latencia` añade un retardo fijo (segundos) a cada
+    petición para simular la red.
+    """
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self._objetos = {}
+        self._ordenadas_cache = {}
+        self._lock = threading.Lock()
+        self.peticiones = 0
+
+    def _peticion(self):
+        with self._lock:
+            self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._peticion()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+        with self._lock:
+            if (Bucket, Key) not in self._objetos:
+                self._ordenadas_cache[Bucket] = None
+            self._objetos[(Bucket, Key)] = (bytes(Body), datetime.now(timezone.utc))
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read())
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._peticion()
+        with self._lock:
+            if (Bucket, Key) not in self._objetos:
+                raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+            datos, modificado = self._objetos[(Bucket, Key)]
+        return {"Body": _Body(datos), "ContentLength": len(datos), "LastModified": modificado}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._peticion()
+        with self._lock:
+            if self._objetos.pop((Bucket, Key), None) is not None:
+                self._ordenadas_cache[Bucket] = None
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self._peticion()
+        with self._lock:
+            if (Bucket, Key) not in self._objetos:
+                self._ordenadas_cache[Bucket] = None
+            self._objetos[(Bucket, Key)] = self._objetos[(CopySource["Bucket"], CopySource["Key"])]
+        return {}
+
+    def _ordenadas(self, bucket):
+        # Lista ordenada de claves del bucket, recalculada sólo tras una escritura
+        if self._ordenadas_cache.get(bucket) is None:
+            self._ordenadas_cache[bucket] = sorted(k for b, k in self._objetos if b == bucket)
+        return self._ordenadas_cache[bucket]
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, MaxKeys=1000,
+                        ContinuationToken=None, StartAfter=None, **kwargs):
+        self._peticion()
+        contenidos, prefijos = [], []
+        ultimo = None
+        truncado = False
+        with self._lock:
+            claves = self._ordenadas(Bucket)
+            inicio = ContinuationToken or StartAfter
+            i = bisect_right(claves, inicio) if inicio else bisect_left(claves, Prefix)
+            for clave in islice(claves, i, None):
+                if not clave.startswith(Prefix):
+                    break
+                comun = None
+                if Delimiter:
+                    resto = clave[len(Prefix):]
+                    if Delimiter in resto:
+                        comun = Prefix + resto.split(Delimiter, 1)[0] + Delimiter
+                        if prefijos and prefijos[-1] == comun:
+                            # Misma "carpeta" que la anterior: no cuenta como resultado nuevo
+                            ultimo = clave
+                            continue
+                if len(contenidos) + len(prefijos) >= MaxKeys:
+                    truncado = True
+                    break
+                if comun:
+                    prefijos.append(comun)
+                else:
+                    datos, modificado = self._objetos[(Bucket, clave)]
+                    contenidos.append({"Key": clave, "Size": len(datos), "LastModified": modificado})
+                ultimo = clave
+
+        respuesta = {"KeyCount": len(contenidos) + len(prefijos), "IsTruncated": truncado}
+        if contenidos:
+            respuesta["Contents"] = contenidos
+        if prefijos:
+            respuesta["CommonPrefixes"] = [{"Prefix": p} for p in prefijos]
+        if truncado:
+            respuesta["NextContinuationToken"] = ultimo
+        return respuesta
+
+    def get_paginator(self, operacion):
+        if operacion != "list_objects_v2":
+            raise NotImplementedError(operacion)
+        return _Paginador(self)
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        Params = Params or {}
+        return f"local://{Params.get('Bucket')}/{Params.get('Key')}"
+
+
+class LocalRekognitionClient:
+    """Rekognition falso: devuelve siempre el mismo texto de etiqueta."""
+
+    def __init__(self, texto="ID: F-0001 Estado: Activo Tipo: Farola LED", latencia=0.0):
+        self.texto = texto
+        self.latencia = latencia
+
+    def detect_text(self, Image, **kwargs):
+        if self.latencia:
+            time.sleep(self.latencia)
+        return {"TextDetections": [{"DetectedText": self.texto, "Type": "LINE"}]}
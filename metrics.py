@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Trazas y métricas ligeras por etapa (Rekognition, traducción, clasificación, S3, Ollama, Slack).
+
+Se activan con la variable de entorno URBANEYE_METRICS=1. Si están desactivadas,
+span() devuelve un contexto vacío y el coste es una comprobación de un booleano.
+Con URBANEYE_METRICS_PORT se expone /metrics en formato Prometheus.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv("URBANEYE_METRICS", "0").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("URBANEYE_METRICS_PORT", "0") or 0)
+
+# Límites superiores (segundos) de los buckets del histograma de latencias
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("urbaneye")
+
+_correlation_id = contextvars.ContextVar("correlation_id", default="-")
+_NULL_SPAN = nullcontext()
+_lock = threading.Lock()
+_server = None
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "correlation_id": _correlation_id.get(),
+        }
+        data.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(_JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos, al estilo Prometheus."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, valor):
+        self.counts[bisect_left(self.buckets, valor)] += 1
+        self.sum += valor
+        self.count += 1
+
+
+_histograms = {}
+_errors = {}
+
+
+def nuevo_id_correlacion():
+    """
+    Genera un ID de correlación y lo asocia al contexto actual (p. ej. un reporte).
+    """
+    cid = uuid.uuid4().hex[:12]
+    _correlation_id.set(cid)
+    return cid
+
+
+def con_contexto(funcion):
+    """
+    Envuelve `funcion` para ejecutarla con el ID de correlación del hilo que la envuelve.
+    Los hilos de un ThreadPoolExecutor no heredan las contextvars:
+
+        pool.submit(con_contexto(subir_miniatura), s3, bucket, clave, datos)
+    """
+    contexto = contextvars.copy_context()
+    # Una copia por llamada: un mismo Context no puede estar activo en dos hilos a la vez
+    return lambda *args, **kwargs: contexto.copy().run(funcion, *args, **kwargs)
+
+
+def log_evento(mensaje, nivel=logging.INFO, **campos):
+    """
+    Log estructurado en JSON con el ID de correlación actual.
+    """
+    if logger.isEnabledFor(nivel):
+        logger.log(nivel, mensaje, extra={"campos": campos})
+
+
+def observar(etapa, segundos, error=False):
+    with _lock:
+        hist = _histograms.get(etapa)
+        if hist is None:
+            hist = _histograms[etapa] = Histogram()
+        hist.observe(segundos)
+        if error:
+            _errors[etapa] = _errors.get(etapa, 0) + 1
+
+
+@contextmanager
+def _span(etapa, campos):
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        duracion = time.perf_counter() - inicio
+        observar(etapa, duracion, error=True)
+        log_evento("etapa fallida", logging.WARNING, etapa=etapa,
+                   duracion_ms=round(duracion * 1000, 2), error=repr(e), **campos)
+        raise
+    duracion = time.perf_counter() - inicio
+    observar(etapa, duracion)
+    log_evento("etapa completada", etapa=etapa, duracion_ms=round(duracion * 1000, 2), **campos)
+
+
+def span(etapa, **campos):
+    """
+    Mide la duración de una etapa:
+
+        with span("rekognition"):
+            rekognition.detect_text(...)
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _span(etapa, campos)
+
+
+def render_prometheus():
+    """
+    Devuelve las métricas en el formato de texto de Prometheus.
+    """
+    lineas = [
+        "# HELP urbaneye_stage_duration_seconds Latencia por etapa del procesamiento.",
+        "# TYPE urbaneye_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for etapa, hist in sorted(_histograms.items()):
+            acumulado = 0
+            for limite, n in zip(hist.buckets, hist.counts):
+                acumulado += n
+                lineas.append(f'urbaneye_stage_duration_seconds_bucket{{stage="{etapa}",le="{limite}"}} {acumulado}')
+            lineas.append(f'urbaneye_stage_duration_seconds_bucket{{stage="{etapa}",le="+Inf"}} {hist.count}')
+            lineas.append(f'urbaneye_stage_duration_seconds_sum{{stage="{etapa}"}} {hist.sum}')
+            lineas.append(f'urbaneye_stage_duration_seconds_count{{stage="{etapa}"}} {hist.count}')
+        lineas.append("# HELP urbaneye_stage_errors_total Errores por etapa del procesamiento.")
+        lineas.append("# TYPE urbaneye_stage_errors_total counter")
+        for etapa, n in sorted(_errors.items()):
+            lineas.append(f'urbaneye_stage_errors_total{{stage="{etapa}"}} {n}')
+    return "\n".join(lineas) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_servidor(puerto=METRICS_PORT):
+    """
+    Arranca (una sola vez por proceso) el endpoint /metrics en un hilo aparte.
+    """
+    global _server
+    if not ENABLED or not puerto:
+        return None
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", puerto), _MetricsHandler)
+            except OSError as e:
+                log_evento("no se pudo abrir el puerto de métricas", logging.WARNING, puerto=puerto, error=str(e))
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            log_evento("endpoint de métricas iniciado", puerto=puerto)
+    return _server
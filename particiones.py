@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Esquema de claves particionado para las incidencias en S3:
+
+    incidencias/categoria=<categoría>/fecha=<yyyy-mm-dd>/<uuid>.json
+
+Las lecturas filtradas sólo listan las particiones que pueden contener resultados.
+Durante la transición se siguen leyendo también las claves antiguas
+(incidencias/<uuid>.json), que se pueden mover al nuevo esquema con:
+
+    python particiones.py migrar            # --simular para ver qué haría
+"""
+import argparse
+import json
+import re
+import sys
+
+from unidecode import unidecode
+
+from metrics import span
+
+PREFIJO = "incidencias/"
+
+
+def slug_categoria(categoria):
+    """
+    'Señalización' → 'senalizacion'
+    """
+    return re.sub(r"[^a-z0-9]+", "-", unidecode(categoria or "Desconocida").lower()).strip("-")
+
+
+def clave_incidencia(inc, incidencia_id):
+    """
+    Clave particionada por categoría y por fecha (UTC) del Timestamp.
+    """
+    fecha = (inc.get("Timestamp") or "")[:10] or "sin-fecha"
+    return f"{PREFIJO}categoria={slug_categoria(inc.get('Categoría'))}/fecha={fecha}/{incidencia_id}.json"
+
+
+def _listar(s3, bucket, prefijo, delimitador=None, prefijos=None):
+    """
+    Genera las claves .json bajo el prefijo página a página, sin acumularlas. Si se
+    pasa la lista `prefijos`, se le añaden los prefijos comunes (particiones o fechas).
+    """
+    params = {"Bucket": bucket, "Prefix": prefijo}
+    if delimitador:
+        params["Delimiter"] = delimitador
+    while True:
+        # Una petición por página, para medir cada list_objects_v2 por separado
+        with span("s3.list_objects_v2"):
+            pagina = s3.list_objects_v2(**params)
+        if prefijos is not None:
+            prefijos += [p["Prefix"] for p in pagina.get("CommonPrefixes", [])]
+        yield from (o["Key"] for o in pagina.get("Contents", []) if o["Key"].endswith(".json"))
+        if not pagina.get("IsTruncated"):
+            return
+        params["ContinuationToken"] = pagina["NextContinuationToken"]
+
+
+def _prefijos(s3, bucket, prefijo):
+    prefijos = []
+    for _ in _listar(s3, bucket, prefijo, "/", prefijos):
+        pass
+    return prefijos
+
+
+def es_clave_antigua(clave):
+    # 'incidencias/<uuid>.json', sin particiones
+    return clave.startswith(PREFIJO) and "/" not in clave[len(PREFIJO):]
+
+
+def _uuid(clave):
+    return clave.rsplit("/", 1)[-1][:-len(".json")]
+
+
+def _valor(prefijo, campo):
+    # 'incidencias/categoria=farola/fecha=2025-01-01/' → valor de 'fecha'
+    match = re.search(rf"{campo}=([^/]+)/", prefijo)
+    return match.group(1) if match else None
+
+
+def listar_claves(s3, bucket, categoria=None, desde=None, hasta=None):
+    """
+    Claves de las incidencias que pueden cumplir los filtros, sin descargar ninguna.
+    Las particiones de otras categorías o fuera del rango de fechas no se listan.
+    Las claves antiguas sin particionar siempre se devuelven (hay que filtrarlas
+    después de descargarlas).
+
+    Las claves antiguas se devuelven al final y sólo si su uuid no ha aparecido ya en
+    una partición, para no contar dos veces una incidencia que `migrar` está copiando.
+    Son las únicas que se guardan en memoria (y desaparecen al terminar la migración).
+    """
+    particiones = []
+    antiguas = {_uuid(c): c for c in _listar(s3, bucket, PREFIJO, "/", particiones)}
+
+    if categoria:
+        objetivo = f"{PREFIJO}categoria={slug_categoria(categoria)}/"
+        particiones = [p for p in particiones if p == objetivo]
+
+    def claves_particionadas():
+        for particion in particiones:
+            if not desde and not hasta:
+                yield from _listar(s3, bucket, particion)
+                continue
+            for prefijo_fecha in _prefijos(s3, bucket, particion):
+                fecha = _valor(prefijo_fecha, "fecha")
+                if (desde and fecha < desde) or (hasta and fecha > hasta):
+                    continue
+                yield from _listar(s3, bucket, prefijo_fecha)
+
+    for clave in claves_particionadas():
+        antiguas.pop(_uuid(clave), None)
+        yield clave
+    yield from antiguas.values()
+
+
+def migrar(s3, bucket, simular=False):
+    """
+    Mueve las incidencias con clave antigua al esquema particionado (copia en el
+    servidor y borra la original). Devuelve el número de objetos movidos.
+    """
+    antiguas = _listar(s3, bucket, PREFIJO, "/")
+    movidas = 0
+    for clave in antiguas:
+        contenido = s3.get_object(Bucket=bucket, Key=clave)["Body"].read().decode("utf-8")
+        if not contenido.strip():
+            continue
+        inc = json.loads(contenido)
+        incidencia_id = clave[len(PREFIJO):-len(".json")]
+        nueva = clave_incidencia(inc, incidencia_id)
+        print(f"{clave} → {nueva}")
+        if not simular:
+            s3.copy_object(Bucket=bucket, Key=nueva, CopySource={"Bucket": bucket, "Key": clave})
+            s3.delete_object(Bucket=bucket, Key=clave)
+        movidas += 1
+    return movidas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Particionado de las claves de incidencias en S3")
+    parser.add_argument("accion", choices=["migrar"])
+    parser.add_argument("--simular", action="store_true", help="Mostrar los cambios sin aplicarlos")
+    parser.add_argument("--bucket", default="incidencias-ayuntamientos-dh")
+    parser.add_argument("--region", default="us-east-1")
+    args = parser.parse_args(argv)
+
+    import boto3
+    s3 = boto3.client("s3", region_name=args.region)
+    movidas = migrar(s3, args.bucket, args.simular)
+    print(f"Incidencias {'a mover' if args.simular else 'movidas'}: {movidas}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,67 @@
 ﻿import os, requests
-from transformers import pipeline
+from metrics import span
+from cascade_classifier import cargar_ultimo
 
 SLACK_WEBHOOK = os.getenv("SLACK_WEBHOOK_URL", "")
-_classifier = pipeline("zero-shot-classification",
-                       model="valhalla/distilbart-mnli-12-1", device="cpu")
+_classifier = None
+_cascada = None
 _LABELS = ["vandalismo", "grafiti", "acto sospechoso", "daño intencional", "robo", "otro"]
 
+# Palabras clave para diferentes niveles de seguridad
+HIGH_SECURITY_KEYWORDS = [
+    # Vandalismo
+    "vandalismo", "vandalizado", "vandalizada", "destrozado", "destrozada", "roto", "rota", 
+    "destruido", "destruida", "quemado", "quemada", "incendiado", "incendiada",
+    # Robo
+    "robo", "robado", "robada", "hurtado", "hurtada", "sustraído", "sustraída",
+    # Daño intencional
+    "intencional", "intencionado", "intencionada", "malicioso", "maliciosa",
+    # Inglés
+    "vandalism", "broken", "damaged", "destroyed", "stolen", "theft", "intentional",
+    "malicious", "sabotage", "sabotaged", "burned", "burnt"
+]
+
+MEDIUM_SECURITY_KEYWORDS = [
+    # Daños
+    "daño", "dañado", "dañada", "mal estado", "desperfecto", "desperfectos",
+    "golpeado", "golpeada", "rayado", "rayada", "abollado", "abollada",
+    # Problemas
+    "problema", "fallo", "avería", "defecto", "defectos", "mal funcionamiento",
+    # Inglés
+    "damage", "poor condition", "defect", "defects", "malfunction",
+    "scratched", "dented", "hit", "impact"
+]
+
+
+def _get_classifier():
+    # El pipeline se carga la primera vez que se necesita, no al importar el módulo
+    global _classifier
+    if _classifier is None:
+        from transformers import pipeline
+        _classifier = pipeline("zero-shot-classification",
+                               model="valhalla/distilbart-mnli-12-1", device="cpu")
+    return _classifier
+
+def _get_cascada():
+    # Modelo lineal entrenado con cascade_classifier.py; False si no hay ninguno
+    global _cascada
+    if _cascada is None:
+        try:
+            _cascada = cargar_ultimo("seguridad") or False
+        except Exception:
+            _cascada = False
+    return _cascada or None
+
+def contar_palabras_clave(text):
+    """
+    Cuenta las palabras clave de nivel alto y medio presentes en el texto:
+    'banco roto y rayado' → (1, 1)
+    """
+    text_lower = text.lower()
+    high_count = sum(1 for word in HIGH_SECURITY_KEYWORDS if word in text_lower)
+    medium_count = sum(1 for word in MEDIUM_SECURITY_KEYWORDS if word in text_lower)
+    return high_count, medium_count
+
 def classify_and_alert(inc):
     # Obtener texto de diferentes campos posibles
     text = inc.get("Descripción adicional (ES)", "") or inc.get("Descripción adicional (EN)", "") or inc.get("Texto Extraído", "")
@@ -17,41 +73,25 @@ def classify_and_alert(inc):
         })
         return inc
 
-    # Palabras clave para diferentes niveles de seguridad
-    high_security_keywords = [
-        # Vandalismo
-        "vandalismo", "vandalizado", "vandalizada", "destrozado", "destrozada", "roto", "rota", 
-        "destruido", "destruida", "quemado", "quemada", "incendiado", "incendiada",
-        # Robo
-        "robo", "robado", "robada", "hurtado", "hurtada", "sustraído", "sustraída",
-        # Daño intencional
-        "intencional", "intencionado", "intencionada", "malicioso", "maliciosa",
-        # Inglés
-        "vandalism", "broken", "damaged", "destroyed", "stolen", "theft", "intentional",
-        "malicious", "sabotage", "sabotaged", "burned", "burnt"
-    ]
-
-    medium_security_keywords = [
-        # Daños
-        "daño", "dañado", "dañada", "mal estado", "desperfecto", "desperfectos",
-        "golpeado", "golpeada", "rayado", "rayada", "abollado", "abollada",
-        # Problemas
-        "problema", "fallo", "avería", "defecto", "defectos", "mal funcionamiento",
-        # Inglés
-        "damage", "poor condition", "defect", "defects", "malfunction",
-        "scratched", "dented", "hit", "impact"
-    ]
-
     # Contar coincidencias de palabras clave
-    text_lower = text.lower()
-    high_count = sum(1 for word in high_security_keywords if word in text_lower)
-    medium_count = sum(1 for word in medium_security_keywords if word in text_lower)
+    high_count, medium_count = contar_palabras_clave(text)
 
     # Clasificación con el modelo
     try:
-        context = f"This is a security incident description: {text}"
-        out = _classifier(context, candidate_labels=_LABELS)
-        label, score = out["labels"][0], out["scores"][0]
+        # Primero el modelo lineal; el zero-shot sólo si no supera el umbral
+        cascada = _get_cascada()
+        prediccion = cascada.predecir(text) if cascada else None
+        if prediccion and cascada.es_confiable(prediccion[1]):
+            label, _, probs = prediccion
+            # Mismo significado que en el zero-shot: la probabilidad de la etiqueta elegida
+            score = probs[label]
+            inc["security_classifier"] = f"lineal:{cascada.version}"
+        else:
+            context = f"This is a security incident description: {text}"
+            with span("zero_shot", tarea="seguridad"):
+                out = _get_classifier()(context, candidate_labels=_LABELS)
+            label, score = out["labels"][0], out["scores"][0]
+            inc["security_classifier"] = "zero-shot"
         
         # Ajustar el score basado en palabras clave
         if high_count > 0:
@@ -82,7 +122,8 @@ def classify_and_alert(inc):
                    f"Score: {score:.2f}\n"
                    f"Palabras clave detectadas: {high_count} alta, {medium_count} media")
             try:
-                requests.post(SLACK_WEBHOOK, json={"text": msg})
+                with span("slack.post"):
+                    requests.post(SLACK_WEBHOOK, json={"text": msg})
             except: pass
 
     except Exception as e:
@@ -100,7 +141,8 @@ def classify_and_alert(inc):
         inc.update({
             "security_label": label,
             "security_score": 0.5 if level != "bajo" else 0.0,
-            "security_level": level
+            "security_level": level,
+            "security_classifier": "heurística"
         })
 
     return inc
\ No newline at end of file
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+# Calles base; cada una se escribe de varias formas (acentos, abreviaturas,
+# mayúsculas) como lo harían los ciudadanos en el formulario.
+_CALLES = [
+    ("Calle", "Colón"), ("Avenida", "del Puerto"), ("Plaza", "del Ayuntamiento"),
+    ("Calle", "Játiva"), ("Avenida", "Blasco Ibáñez"), ("Calle", "Sagunto"),
+    ("Avenida", "de Aragón"), ("Plaza", "de la Reina"), ("Calle", "Cirilo Amorós"),
+    ("Avenida", "Reino de Valencia"), ("Calle", "San Vicente Mártir"),
+    ("Plaza", "de España"), ("Calle", "Cádiz"), ("Avenida", "Peris y Valero"),
+    ("Calle", "Sueca"), ("Avenida", "de la Constitución"), ("Calle", "Mayor"),
+    ("Plaza", "Cánovas del Castillo"), ("Calle", "Ruzafa"), ("Avenida", "Pío XII"),
+]
+
+_ABREVIATURAS = {
+    "Calle": ["Calle", "calle", "C/", "CALLE", ""],
+    "Avenida": ["Avenida", "Avda.", "avda", "Av.", "AVENIDA"],
+    "Plaza": ["Plaza", "Pza", "Pza.", "plaza", "PLAZA"],
+}
+
+_CIUDADES = ["Valencia", "València", "valencia", ""]
+
+# (prefijo del ID, categoría, tipos impresos en la etiqueta, descripciones ES, descripciones EN)
+_ELEMENTOS = [
+    ("F", "Farola", ["Farola LED", "Farola de vapor de sodio", "Luminaria LED 60W"],
+     ["La farola está apagada desde hace días", "farola rota, el cristal está en el suelo",
+      "La luz parpadea toda la noche", "poste de luz inclinado tras un golpe"],
+     ["The streetlight is off", "Broken lamp, glass on the ground", "The light keeps flickering"]),
+    ("B", "Banco", ["Banco de madera", "Banco metálico"],
+     ["El banco está roto y tiene grafitis", "Faltan tablas en el banco",
+      "banco quemado por vandalismo", "el asiento está rayado"],
+     ["The bench is broken", "Someone burned the bench", "Bench covered in graffiti"]),
+    ("P", "Papelera", ["Papelera 50L", "Papelera de acero"],
+     ["La papelera está llena y desborda", "papelera arrancada del poste",
+      "La papelera está abollada"],
+     ["The trash can is overflowing", "Litter bin was stolen", "Bin is dented"]),
+    ("C", "Contenedor", ["Contenedor de reciclaje", "Contenedor orgánico"],
+     ["El contenedor está quemado", "contenedor volcado en la calzada",
+      "La tapa del contenedor no cierra"],
+     ["The recycling container is burnt", "Container knocked over", "Lid is broken"]),
+    ("S", "Señalización", ["Señal de tráfico", "Señal de stop", "Panel informativo"],
+     ["La señal de stop está doblada", "Señal tapada por un árbol",
+      "han robado la señal de tráfico"],
+     ["The stop sign is bent", "Traffic sign stolen", "Sign is covered by graffiti"]),
+]
+
+_ESTADOS = ["Activo", "Averiado", "Mantenimiento", "Retirado"]
+
+_OBSERVACIONES = ["Sin incidencias previas", "Revisado por brigada", "Zona de alto tránsito",
+                  "Pendiente de sustitución", "Cableado renovado"]
+
+
+def _variante_calle(rng, prefijo, nombre):
+    abreviatura = rng.choice(_ABREVIATURAS[prefijo])
+    if rng.random() < 0.3:
+        # El ciudadano escribe sin tildes
+        nombre = (nombre.replace("á", "a").replace("é", "e").replace("í", "i")
+                  .replace("ó", "o").replace("ú", "u").replace("ñ", "n"))
+    if rng.random() < 0.15:
+        nombre = nombre.lower()
+    calle = f"{abreviatura} {nombre}".strip()
+    partes = [calle]
+    if rng.random() < 0.7:
+        partes.append(str(rng.randint(1, 180)))
+    ciudad = rng.choice(_CIUDADES)
+    if ciudad:
+        partes.append(ciudad)
+    return ", ".join(partes)
+
+
+def _texto_etiqueta(rng, asset_id, estado, instalacion, revision, tipo, observaciones):
+    # Las líneas que devuelve Rekognition se unen con espacios, a veces con ruido OCR
+    lineas = [
+        "AYUNTAMIENTO DE VALENCIA",
+        f"ID: {asset_id}",
+        f"Estado: {estado}",
+        f"Fecha de instalación: {instalacion}",
+        f"Última revisión: {revision}",
+        f"Tipo: {tipo}",
+    ]
+    if observaciones:
+        lineas.append(f"Observaciones: {observaciones}")
+    if rng.random() < 0.1:
+        # Línea ilegible
+        lineas.insert(rng.randint(1, len(lineas)), "l1|I0O ..")
+    return " ".join(lineas)
+
+
+def generar_incidencia(rng, ahora):
+    """
+    Genera una incidencia con la misma forma que las que guarda reportar_incidencia().
+    """
+    prefijo_id, categoria, tipos, descs_es, descs_en = rng.choice(_ELEMENTOS)
+    prefijo_calle, nombre_calle = rng.choice(_CALLES)
+
+    asset_id = f"{prefijo_id}-{rng.randint(1, 9999):04d}"
+    estado = rng.choice(_ESTADOS)
+    instalacion = ahora - timedelta(days=rng.randint(365, 365 * 15))
+    revision = instalacion + timedelta(days=rng.randint(30, 365))
+    tipo = rng.choice(tipos)
+    observaciones = rng.choice(_OBSERVACIONES) if rng.random() < 0.6 else None
+    texto = _texto_etiqueta(rng, asset_id, estado, instalacion.strftime("%Y-%m-%d"),
+                            revision.strftime("%Y-%m-%d"), tipo, observaciones)
+
+    if rng.random() < 0.7:
+        descripcion_es = rng.choice(descs_es)
+        descripcion_en = rng.choice(descs_en)
+    else:
+        descripcion_en = rng.choice(descs_en)
+        descripcion_es = descripcion_en
+
+    timestamp = ahora - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+
+    return {
+        'ID': asset_id,
+        'Ubicación': _variante_calle(rng, prefijo_calle, nombre_calle),
+        'Estado': estado,
+        'Fecha de instalación': instalacion.strftime("%Y-%m-%d"),
+        'Última revisión': revision.strftime("%Y-%m-%d"),
+        'Tipo': tipo,
+        'Observaciones': observaciones or "No disponible",
+        'Descripción adicional (EN)': descripcion_en,
+        'Descripción adicional (ES)': descripcion_es,
+        'Texto Extraído': texto,
+        'Timestamp': timestamp.isoformat(),
+        'Categoría': categoria,
+        'Probabilidades': {categoria: round(rng.uniform(0.4, 0.95), 4)},
+    }
+
+
+def iterar_incidencias(n, semilla=0):
+    """
+    Generador de n incidencias sintéticas reproducibles a partir de la semilla.
+    """
+    rng = random.Random(semilla)
+    ahora = datetime(2025, 1, 1)
+    for _ in range(n):
+        yield generar_incidencia(rng, ahora)
+
+
+def generar_incidencias(n, semilla=0):
+    return list(iterar_incidencias(n, semilla))
+
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from cascade_classifier import _dataset
+
+
+def test_categoria_solo_etiquetas_del_zero_shot():
+    incidencias = [
+        {"Descripción adicional (EN)": "broken lamp", "Categoría": "Farola", "Clasificador": "zero-shot"},
+        {"Descripción adicional (EN)": "old bench", "Categoría": "Banco"},  # anterior a la cascada
+        {"Descripción adicional (EN)": "lamp off", "Categoría": "Farola", "Clasificador": "lineal:20250101"},
+        {"Descripción adicional (EN)": "full bin", "Categoría": "Papelera", "Clasificador": "heurística"},
+        {"Descripción adicional (EN)": "???", "Categoría": "Desconocida", "Clasificador": "zero-shot"},
+    ]
+    assert _dataset(incidencias, "categoria") == (["broken lamp", "old bench"], ["Farola", "Banco"])
+
+
+def test_seguridad_descarta_fallback_heuristico():
+    incidencias = [
+        {"Descripción adicional (ES)": "pintadas", "security_label": "vandalismo",
+         "security_classifier": "zero-shot"},
+        {"Descripción adicional (ES)": "roto", "security_label": "daño intencional",
+         "security_classifier": "heurística"},
+        {"Descripción adicional (ES)": "quemado", "security_label": "vandalismo",
+         "security_classifier": "lineal:20250101"},
+        {"Descripción adicional (ES)": "sucio", "security_label": "otro"},
+    ]
+    assert _dataset(incidencias, "seguridad") == (["pintadas", "sucio"], ["vandalismo", "otro"])
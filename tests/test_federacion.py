@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from federacion import Federacion
+
+
+@pytest.fixture
+def federacion(monkeypatch, tmp_path):
+    monkeypatch.delenv("URBANEYE_SQLITE", raising=False)
+    monkeypatch.setenv("URBANEYE_SQLITE_DIR", str(tmp_path))
+    return Federacion({
+        "por_defecto": "valencia",
+        "municipios": [
+            {"id": "valencia", "nombre": "Valencia", "bucket": "b-valencia", "alias": ["València"]},
+            {"id": "alboraya", "nombre": "Alboraya", "bucket": "b-alboraya"},
+            {"id": "xativa", "nombre": "Xàtiva", "bucket": "b-xativa", "alias": ["Játiva"]},
+        ],
+    })
+
+
+@pytest.mark.parametrize("ubicacion, esperado", [
+    ("Calle Mayor, 5, Alboraya", "alboraya"),
+    ("Plaza del Mercado, 1, XÀTIVA", "xativa"),
+    ("Avenida del Puerto, 12, València", "valencia"),
+    ("Calle Játiva, 3", "valencia"),
+    ("Calle de Alboraya, 12", "valencia"),
+    ("Calle de Alboraya, 12, Valencia", "valencia"),
+    ("Alboraya", "valencia"),
+    ("", "valencia"),
+])
+def test_resolver_sólo_mira_la_localidad(federacion, ubicacion, esperado):
+    assert federacion.resolver(ubicacion).id == esperado
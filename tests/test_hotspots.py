@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from hotspots import ContadorVentana, HotspotDetector
+from street_bundling import normalize_street
+
+
+@pytest.fixture(params=["UTC", "Europe/Madrid", "America/New_York"])
+def zona_horaria(request, monkeypatch):
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _incidencia(minutos_atras, calle="Calle Colón, 3", asset_id="F-0001"):
+    # Igual que app.py: hora UTC sin zona
+    ts = datetime.utcnow() - timedelta(minutes=minutos_atras)
+    return {"Ubicación": calle, "ID": asset_id, "Timestamp": ts.isoformat()}
+
+
+def test_hotspots_recientes_visibles_en_cualquier_zona_horaria(zona_horaria):
+    detector = HotspotDetector(umbral_reportes=3)
+    eventos = []
+    for minutos in (20, 10, 1):
+        eventos += detector.registrar(_incidencia(minutos))
+
+    assert {e["tipo"] for e in eventos} == {"calle", "activo"}
+    activos = detector.hotspots_activos()
+    assert {(h["tipo"], h["clave"]) for h in activos} == {("calle", normalize_street("Calle Colón")), ("activo", "F-0001")}
+
+
+def test_desde_en_utc(zona_horaria):
+    detector = HotspotDetector(umbral_reportes=1)
+    inc = _incidencia(0)
+    evento = detector.registrar(inc)[0]
+    desde = datetime.fromisoformat(evento["desde"])
+    assert desde.tzinfo is not None
+    esperado = datetime.fromisoformat(inc["Timestamp"]).replace(tzinfo=timezone.utc)
+    assert abs((desde - esperado).total_seconds()) < 1
+
+
+def test_timestamp_con_zona_se_respeta():
+    detector = HotspotDetector(umbral_reportes=1)
+    ahora = datetime.now(timezone(timedelta(hours=2)))
+    evento = detector.registrar({"Ubicación": "Calle Mayor", "ID": "No disponible",
+                                 "Timestamp": ahora.isoformat()})[0]
+    assert abs(datetime.fromisoformat(evento["desde"]).timestamp() - ahora.timestamp()) < 1
+
+
+def test_incidencias_antiguas_no_son_hotspot():
+    detector = HotspotDetector(umbral_reportes=3)
+    for _ in range(3):
+        detector.registrar(_incidencia(60 * 24 * 3))
+    assert detector.hotspots_activos() == []
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_sumas_acumuladas_coinciden_con_el_anillo(semilla):
+    rng = random.Random(semilla)
+    contador = ContadorVentana(segundos=60, n_intervalos=10, intervalos_ventana=3)
+    ts = 1_700_000_000.0
+    for _ in range(2000):
+        # Casi siempre hacia delante; a veces saltos largos o incidencias atrasadas
+        ts += rng.choice([0, 5, 30, 61, 200, 900])
+        contador.registrar(ts - rng.choice([0, 0, 0, 120, 400, 3600]))
+        ahora = max(ts, contador.actual * 60)
+        contador.avanzar(ahora)
+        serie = contador.serie(ahora)
+        historico = serie[:-3]
+        assert contador.suma_ventana == sum(serie[-3:])
+        assert contador.suma_historico == sum(historico)
+        assert contador.suma2_historico == sum(c * c for c in historico)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from exportar import iterar_incidencias
+from federacion import Federacion
+
+
+def _en_contexto_nuevo(funcion):
+    # Cada test con su propio contexto, como cada reporte en la aplicación
+    return contextvars.Context().run(funcion)
+
+
+def test_con_contexto_propaga_el_id_a_los_hilos():
+    def probar():
+        cid = metrics.nuevo_id_correlacion()
+        leer = metrics.con_contexto(metrics._correlation_id.get)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            vistos = list(pool.map(lambda _: leer(), range(200)))
+            sin_envolver = pool.submit(metrics._correlation_id.get).result()
+        assert set(vistos) == {cid}
+        assert sin_envolver == "-"
+    _en_contexto_nuevo(probar)
+
+
+class _S3Registro:
+    def __init__(self):
+        self.ids = []
+
+    def get_object(self, Bucket, Key):
+        self.ids.append(metrics._correlation_id.get())
+        return {"Body": io.BytesIO(json.dumps({"ID": Key}).encode("utf-8"))}
+
+
+def test_descargas_en_paralelo_con_el_id_del_reporte():
+    def probar():
+        cid = metrics.nuevo_id_correlacion()
+        s3 = _S3Registro()
+        incidencias = list(iterar_incidencias(s3, "b", [f"incidencias/{i}.json" for i in range(50)]))
+        assert len(incidencias) == 50
+        assert set(s3.ids) == {cid}
+    _en_contexto_nuevo(probar)
+
+
+def test_consultar_todos_con_el_id_de_la_consulta(monkeypatch, tmp_path):
+    monkeypatch.delenv("URBANEYE_SQLITE", raising=False)
+    monkeypatch.setenv("URBANEYE_SQLITE_DIR", str(tmp_path))
+    federacion = Federacion({"municipios": [
+        {"id": m, "nombre": m, "bucket": m, "almacen": "sqlite"} for m in ("a", "b", "c")]})
+
+    def probar():
+        cid = metrics.nuevo_id_correlacion()
+        resultados = federacion.consultar_todos(lambda municipio, almacen, cancelado: metrics._correlation_id.get())
+        assert {r["resultado"] for r in resultados.values()} == {cid}
+    _en_contexto_nuevo(probar)
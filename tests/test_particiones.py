@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+import types
+
+import pytest
+from botocore.exceptions import ClientError
+
+from exportar import iterar_incidencias
+from local_s3 import LocalS3Client
+from particiones import PREFIJO, clave_incidencia, listar_claves
+
+BUCKET = "incidencias"
+
+
+def _incidencia(n):
+    return {"ID": f"F-{n:04d}", "Categoría": "Farola", "Timestamp": f"2025-01-{n % 28 + 1:02d}T10:00:00"}
+
+
+@pytest.fixture
+def s3():
+    return LocalS3Client()
+
+
+def test_listar_claves_es_perezoso(s3):
+    for n in range(2500):
+        s3.put_object(Bucket=BUCKET, Key=clave_incidencia(_incidencia(n), f"id-{n}"), Body=json.dumps(_incidencia(n)))
+    claves = listar_claves(s3, BUCKET)
+    assert isinstance(claves, types.GeneratorType)
+    next(claves)
+    # Raíz (sin claves antiguas) y una sola página de la partición
+    assert s3.peticiones == 2500 + 2
+    assert len(list(claves)) == 2499
+
+
+def test_clave_copiada_durante_la_migracion_se_devuelve_una_vez(s3):
+    inc = _incidencia(1)
+    antigua, nueva = f"{PREFIJO}abc.json", clave_incidencia(inc, "abc")
+    s3.put_object(Bucket=BUCKET, Key=antigua, Body=json.dumps(inc))
+    s3.put_object(Bucket=BUCKET, Key=nueva, Body=json.dumps(inc))
+    assert list(listar_claves(s3, BUCKET)) == [nueva]
+
+
+def test_clave_antigua_borrada_tras_listarla_se_omite(s3):
+    inc = _incidencia(1)
+    antigua = f"{PREFIJO}abc.json"
+    s3.put_object(Bucket=BUCKET, Key=antigua, Body=json.dumps(inc))
+    otra = clave_incidencia(_incidencia(2), "def")
+    s3.put_object(Bucket=BUCKET, Key=otra, Body=json.dumps(_incidencia(2)))
+    claves = list(listar_claves(s3, BUCKET))
+    s3.delete_object(Bucket=BUCKET, Key=antigua)
+    assert [i["ID"] for i in iterar_incidencias(s3, BUCKET, claves)] == ["F-0002"]
+
+
+def test_clave_particionada_que_falta_sigue_fallando(s3):
+    with pytest.raises(ClientError):
+        list(iterar_incidencias(s3, BUCKET, [clave_incidencia(_incidencia(1), "abc")]))
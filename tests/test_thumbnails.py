@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+from PIL import Image
+
+from almacenamiento import AlmacenS3, AlmacenSQLite
+from local_s3 import LocalS3Client
+from thumbnails import backfill, clave_miniatura
+
+BUCKET = "incidencias"
+
+
+def _png():
+    datos = io.BytesIO()
+    Image.new("RGB", (640, 480), "red").save(datos, format="PNG")
+    return datos.getvalue()
+
+
+@pytest.fixture(params=["s3", "sqlite"])
+def almacen_y_s3(request):
+    s3 = LocalS3Client()
+    almacen = AlmacenS3(s3, BUCKET) if request.param == "s3" else AlmacenSQLite(":memory:")
+    return almacen, s3
+
+
+def test_backfill_completa_las_miniaturas_en_el_almacen(almacen_y_s3):
+    almacen, s3 = almacen_y_s3
+    s3.put_object(Bucket=BUCKET, Key="images/a.png", Body=_png())
+    base = {"Categoría": "Farola", "Timestamp": "2025-01-02T10:00:00"}
+    almacen.put_incident({**base, "ID": "F-1", "Imagen": "images/a.png"}, "a")
+    almacen.put_incident({**base, "ID": "F-2", "Imagen": "images/a.png", "Miniatura": "ya/existe.webp"}, "b")
+    almacen.put_incident({**base, "ID": "F-3"}, "c")
+
+    assert backfill(almacen, s3, BUCKET) == 1
+    por_id = {inc["ID"]: inc for inc in almacen.iterar()}
+    assert len(por_id) == 3
+    assert por_id["F-1"]["Miniatura"] == clave_miniatura("images/a.png")
+    assert por_id["F-2"]["Miniatura"] == "ya/existe.webp"
+    assert "Miniatura" not in por_id["F-3"]
+    s3.get_object(Bucket=BUCKET, Key=clave_miniatura("images/a.png"))
+    assert backfill(almacen, s3, BUCKET) == 0
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Miniaturas de las fotos de las incidencias.
+
+Al subir una foto se guarda también una miniatura WebP (JPEG si Pillow no tiene
+soporte WebP) en thumbnails/<uuid>.webp. Las incidencias que ya tienen 'Imagen'
+pero no 'Miniatura' se pueden completar con (todos los municipios de
+URBANEYE_MUNICIPIOS, o sólo uno con --municipio; cada uno con su almacén):
+
+    python thumbnails.py backfill
+    python thumbnails.py backfill --municipio alboraya
+
+Las incidencias anteriores a este cambio no guardaban la clave de la foto, así que
+no se pueden enlazar con su imagen.
+"""
+import argparse
+import io
+import sys
+
+from PIL import Image, ImageOps, features
+
+TAMANO_MINIATURA = (320, 320)
+CALIDAD = 70
+FORMATO = "WEBP" if features.check("webp") else "JPEG"
+EXTENSION = {"WEBP": "webp", "JPEG": "jpg"}[FORMATO]
+CONTENT_TYPE = {"WEBP": "image/webp", "JPEG": "image/jpeg"}[FORMATO]
+
+
+def clave_miniatura(image_key):
+    """
+    'images/1234.png' → 'thumbnails/1234.webp'
+    """
+    nombre = image_key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return f"thumbnails/{nombre}.{EXTENSION}"
+
+
+def generar_miniatura(datos: bytes) -> bytes:
+    """
+    Reduce la imagen a TAMANO_MINIATURA manteniendo la proporción.
+    """
+    img = Image.open(io.BytesIO(datos))
+    # Con JPEG el decodificador puede reducir directamente al leer
+    img.draft("RGB", TAMANO_MINIATURA)
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.thumbnail(TAMANO_MINIATURA)
+    salida = io.BytesIO()
+    img.save(salida, FORMATO, quality=CALIDAD)
+    return salida.getvalue()
+
+
+def subir_miniatura(s3, bucket, image_key, datos):
+    """
+    Genera y sube la miniatura de la imagen; devuelve su clave.
+    """
+    clave = clave_miniatura(image_key)
+    s3.put_object(Bucket=bucket, Key=clave, Body=generar_miniatura(datos), ContentType=CONTENT_TYPE)
+    return clave
+
+
+def backfill(almacen, s3, bucket):
+    """
+    Genera la miniatura de las incidencias del almacén que tienen 'Imagen' pero no
+    'Miniatura'. Las fotos y las miniaturas están en el bucket del municipio.
+    """
+    generadas = 0
+    for incidencia_id, inc in almacen.iterar(con_id=True):
+        if not inc.get("Imagen") or inc.get("Miniatura"):
+            continue
+        try:
+            original = s3.get_object(Bucket=bucket, Key=inc["Imagen"])["Body"].read()
+            inc["Miniatura"] = subir_miniatura(s3, bucket, inc["Imagen"], original)
+        except Exception as e:
+            print(f"{incidencia_id}: no se pudo generar la miniatura ({e})")
+            continue
+        almacen.put_incident(inc, incidencia_id)
+        generadas += 1
+        print(f"{incidencia_id} → {inc['Miniatura']}")
+    return generadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Miniaturas de las fotos de incidencias")
+    parser.add_argument("accion", choices=["backfill"])
+    parser.add_argument("--municipio", help="ID del municipio (por defecto, todos)")
+    args = parser.parse_args(argv)
+
+    from federacion import Federacion
+    federacion = Federacion.desde_entorno()
+    if args.municipio and args.municipio not in federacion.municipios:
+        parser.error(f"Municipio desconocido: {args.municipio}")
+    municipios = [federacion.municipios[args.municipio]] if args.municipio else federacion.municipios.values()
+    for municipio in municipios:
+        generadas = backfill(federacion.almacen(municipio), federacion.s3(municipio), municipio.bucket)
+        print(f"{municipio.nombre}: {generadas} miniaturas generadas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())